@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Checks fetch.py against a local http.server: resumed downloads (with a server that honours Range
+requests, one that ignores them, and a connection dropped mid-body), checksum verification and
+pinning, and the streaming extraction of .bz2 and .zip archives. Nothing leaves localhost.
+
+    python data/check_fetch.py
+"""
+
+import bz2
+import hashlib
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fetch import ChecksumError, fetch
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves server.files; honours Range requests when server.ranges, and cuts the first response of
+    a file after server.cut_after bytes when it is set
+    """
+
+    def do_GET(self):
+        server = self.server
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        server.requests.append((self.path, self.headers.get("Range")))
+        start = int(match.group(1)) if match and server.ranges else 0
+        if match and server.ranges and start >= len(data):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = data[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if server.cut_after is not None and self.path not in server.cut:
+            # announce the whole body, send part of it and drop the connection
+            server.cut.add(self.path)
+            self.wfile.write(body[:server.cut_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(files, ranges=True, cut_after=None):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.files, server.ranges, server.cut_after = files, ranges, cut_after
+    server.requests, server.cut = [], set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def source(server, name, data, path, extract=None, checksum=True):
+    return {"name": name, "url": f"http://127.0.0.1:{server.server_address[1]}/{name}", "path": path,
+            "sha256": sha256(data) if checksum else None, "extract": extract}
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def check(name, condition):
+    if not condition:
+        raise AssertionError(name)
+    print(f"[ok] {name}")
+
+
+def main():
+    text = os.urandom(1 << 16).hex().encode("ascii")
+    payload = bz2.compress(text)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("corpus/a.xml", text[:1000])
+        z.writestr("corpus/b.xml", text[1000:])
+    archive = archive.getvalue()
+    evil = io.BytesIO()
+    with zipfile.ZipFile(evil, "w") as z:
+        z.writestr("../outside.txt", b"x")
+    files = {"/ag": payload, "/blogs": archive, "/evil": evil.getvalue()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        def partial(name, path, data, size):
+            os.makedirs(os.path.dirname(os.path.join(directory, path)), exist_ok=True)
+            with open(os.path.join(directory, path + ".part"), "wb") as f:
+                f.write(data[:size])
+
+        # resume with a Range request, then stream the bz2 extraction
+        server = serve(files)
+        partial("ag", "r/ag.xml.bz", payload, len(payload) // 2)
+        fetch(source(server, "ag", payload, "r/ag.xml.bz", "bz2"), directory)
+        check("range resume requests the missing bytes", server.requests == [("/ag", f"bytes={len(payload) // 2}-")])
+        check("resumed file is complete", read(os.path.join(directory, "r/ag.xml.bz")) == payload)
+        check("bz2 extraction", read(os.path.join(directory, "r/ag.xml")) == text)
+
+        # a .part that is already complete gets 416 and is kept
+        partial("ag", "c/ag.xml.bz", payload, len(payload))
+        fetch(source(server, "ag", payload, "c/ag.xml.bz"), directory)
+        check("complete .part (416) is kept", read(os.path.join(directory, "c/ag.xml.bz")) == payload)
+
+        # zip extraction, and members escaping the directory are refused
+        fetch(source(server, "blogs", archive, "z/blogs.zip", "zip"), directory)
+        check("zip extraction", read(os.path.join(directory, "z/corpus/a.xml")) + read(os.path.join(directory, "z/corpus/b.xml")) == text)
+        try:
+            fetch(source(server, "evil", files["/evil"], "e/evil.zip", "zip"), directory)
+            check("zip member outside of the directory is refused", False)
+        except ValueError:
+            check("zip member outside of the directory is refused", not os.path.exists(os.path.join(directory, "outside.txt")))
+
+        # checksums: a mismatch removes the file, a missing sha256 fails unless pinned
+        bad = dict(source(server, "ag", payload, "m/ag.xml.bz"), sha256="0" * 64)
+        try:
+            fetch(bad, directory)
+            check("sha256 mismatch fails", False)
+        except ChecksumError:
+            check("sha256 mismatch fails and removes the file", not os.path.exists(os.path.join(directory, "m/ag.xml.bz")))
+        unpinned = source(server, "ag", payload, "u/ag.xml.bz", checksum=False)
+        try:
+            fetch(unpinned, directory)
+            check("missing sha256 fails", False)
+        except ChecksumError:
+            check("missing sha256 fails and keeps the download", os.path.exists(os.path.join(directory, "u/ag.xml.bz")))
+        n = len(server.requests)
+        fetch(unpinned, directory, pin=True)
+        check("--pin records the sha256 without downloading again", unpinned["sha256"] == sha256(payload) and len(server.requests) == n)
+        server.shutdown()
+
+        # a server ignoring Range answers 200 with the whole file: start over instead of appending
+        server = serve(files, ranges=False)
+        partial("ag", "n/ag.xml.bz", payload, len(payload) // 3)
+        fetch(source(server, "ag", payload, "n/ag.xml.bz"), directory)
+        check("ignored range restarts the download", read(os.path.join(directory, "n/ag.xml.bz")) == payload)
+        server.shutdown()
+
+        # connection dropped mid-body: the retry resumes from the .part
+        server = serve(files, cut_after=len(payload) // 4)
+        fetch(source(server, "ag", payload, "d/ag.xml.bz"), directory, retries=2)
+        check("dropped connection is resumed", server.requests == [("/ag", None), ("/ag", f"bytes={len(payload) // 4}-")]
+              and read(os.path.join(directory, "d/ag.xml.bz")) == payload)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
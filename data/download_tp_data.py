@@ -5,15 +5,22 @@ Created on Wed Dec 19 12:05:05 2018
 @author: piesauce
 """
 
+import argparse
+import json
 import requests
 from bs4 import BeautifulSoup as bs
 import pathlib
-import wget
-import zipfile
+import sys
+
+from fetch import MANIFEST, fetch_all, load_manifest
 
 
 url = 'https://bitbucket.org/lowlands/release/src/fd60e8b4fbb12f0175e0f26153e289bbe2bfd71c/WWW2015/data/'
 
+parser = argparse.ArgumentParser(description="Download the Trustpilot files into src/, verified against sources.json")
+parser.add_argument("--pin", action="store_true", help="Record the sha256 of files that have none in sources.json")
+args = parser.parse_args()
+
 
 
 r = requests.get(url)
@@ -34,13 +41,22 @@ for i, link in enumerate(soup.findAll('a')):
         file_names.append(pathlib.Path(full_name).name.split('.zip', 1)[0] + '.zip') 
       
      
-names_urls = zip(file_names, urls)
-
-for file_name, link in names_urls:
-    wget.download(link, out=file_name)
-    zip_ref = zipfile.ZipFile(file_name, 'r')
-    zip_ref.extractall()
-    zip_ref.close()
+# the file list is scraped, the checksums come from sources.json as for fetch.py
+manifest = load_manifest()
+known = {source["name"]: source for source in manifest}
+sources = []
+for file_name, link in zip(file_names, urls):
+    if file_name not in known:
+        known[file_name] = {"name": file_name, "url": link, "path": "src/" + file_name, "sha256": None, "extract": "zip"}
+        manifest.append(known[file_name])
+    sources.append(known[file_name])
+
+failed = fetch_all(sources, pathlib.Path(MANIFEST).parent, pin=args.pin)
+if args.pin:
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.write("\n")
+sys.exit(1 if failed else 0)
     
 
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads the datasets listed in sources.json.
+
+Files are fetched in parallel, into `{path}.part`, and an interrupted download resumes with an HTTP
+Range request instead of starting over. Every file is checked against the sha256 of the manifest
+before .bz2/.bz and .zip archives are decompressed by streaming, so memory stays constant whatever
+the file size. A source without a sha256 is an error: --pin records the sha256 of the download
+in the manifest instead (check the file first).
+
+    python data/fetch.py              # every source
+    python data/fetch.py blogs --workers 2
+    python data/fetch.py ag --pin     # first download of a new source
+    python data/check_fetch.py        # resume/checksum/extraction checks against a local server
+"""
+
+import argparse
+import bz2
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+CHUNK_SIZE = 1 << 20
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sources.json")
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def load_manifest(filename=MANIFEST):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def sha256sum(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(url, path, timeout=60):
+    """
+    Downloads url into path, resuming from `{path}.part` when the server accepts Range requests
+    """
+    part = path + ".part"
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416:
+            raise
+        # range not satisfiable: the part file is already complete
+        os.replace(part, path)
+        return
+    with response:
+        if offset and response.status != 206:
+            # the server ignored the range, start over
+            offset = 0
+        length = response.headers.get("Content-Length")
+        with open(part, "ab" if offset else "wb") as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+            size = f.tell()
+    # a dropped connection ends the body early without an error: keep the .part to resume from
+    if length is not None and size != offset + int(length):
+        raise OSError(f"{url}: connection closed after {size} of {offset + int(length)} bytes")
+    os.replace(part, path)
+
+
+def extract(path, kind):
+    directory = os.path.dirname(path)
+    if kind == "bz2":
+        with bz2.open(path, "rb") as src, open(os.path.splitext(path)[0], "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    elif kind == "zip":
+        root = os.path.realpath(directory)
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                target = os.path.realpath(os.path.join(directory, member.filename))
+                if not target.startswith(root + os.sep):
+                    raise ValueError(f"{path}: {member.filename} is outside of the archive directory")
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(member) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    elif kind is not None:
+        raise ValueError(f"unknown archive type: {kind}")
+
+
+def fetch(source, directory, retries=5, timeout=60, pin=False):
+    """
+    Downloads, verifies and extracts one source of the manifest. With pin, a source without sha256
+    gets the one of the download (for the caller to save in the manifest) instead of failing.
+
+    Returns:
+        str: sha256 of the downloaded file
+    """
+    path = os.path.join(directory, source["path"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        for attempt in range(retries):
+            try:
+                download(source["url"], path, timeout)
+                break
+            except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+                # HTTPException: malformed or truncated responses; the .part is kept and resumed
+                if attempt == retries - 1:
+                    raise
+                print(f"[{source['name']}] {e}, resuming in {2 ** attempt}s")
+                time.sleep(2 ** attempt)
+
+    checksum = sha256sum(path)
+    if source.get("sha256") is None:
+        if not pin:
+            # the download is kept, so --pin does not fetch it again
+            raise ChecksumError(f"{source['name']}: no sha256 in the manifest to verify {path} (sha256 {checksum}), "
+                                f"check the file and record it with --pin")
+        source["sha256"] = checksum
+    elif checksum != source["sha256"]:
+        os.remove(path)
+        raise ChecksumError(f"{source['name']}: sha256 {checksum} != {source['sha256']}")
+    extract(path, source.get("extract"))
+    return checksum
+
+
+def fetch_all(sources, directory, workers=4, retries=5, pin=False):
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, source, directory, retries, pin=pin): source for source in sources}
+        for future in as_completed(futures):
+            name = futures[future]["name"]
+            try:
+                print(f"[{name}] done, sha256: {future.result()}")
+            except Exception as e:
+                print(f"[{name}] failed: {e}")
+                failed.append(name)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the datasets of the manifest")
+    parser.add_argument("names", nargs="*", help="Sources to download, [default=all]")
+    parser.add_argument("--manifest", default=MANIFEST, help="Manifest of the sources")
+    parser.add_argument("--directory", default=os.path.dirname(MANIFEST), help="Download directory")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel downloads")
+    parser.add_argument("--retries", type=int, default=5, help="Attempts per file")
+    parser.add_argument("--pin", action="store_true", help="Record the sha256 of sources that have none in the manifest")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    sources = [s for s in manifest if not args.names or s["name"] in args.names]
+    failed = fetch_all(sources, args.directory, args.workers, args.retries, pin=args.pin)
+    if args.pin:
+        with open(args.manifest, "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.write("\n")
+    sys.exit(1 if failed else 0)
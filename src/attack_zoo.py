@@ -0,0 +1,125 @@
+"""
+Attack evaluation over cached representations r(x).
+
+The representations are extracted once; a logistic regression attacker, a stack of MLP attackers
+(BatchedMLPAttacker) and a kNN attacker are then trained side by side on them. The reported
+leakage is per attribute and per attacker, plus the upper bound over attackers.
+"""
+import time
+
+import torch
+import torch.nn as nn
+from torch import optim
+
+from .models.zoo import BatchedMLPAttacker
+
+
+AUX_NAMES = ["gender", "age"]
+
+
+def knn_predict(train_hidden, train_target, query_hidden, k=10, block_size=4096):
+    """
+    Majority vote of the k nearest training representations (euclidean), for each binary private variable.
+    Distances are computed block by block as ||q||^2 + ||t||^2 - 2 q.t so that memory stays
+    bounded by block_size x len(train_hidden). With fewer than k training rows, all of them vote.
+    """
+    k = min(k, len(train_hidden))
+    train_sq = (train_hidden ** 2).sum(dim=1)
+    target = train_target.float()
+    predicts = []
+    for start in range(0, len(query_hidden), block_size):
+        query = query_hidden[start:start + block_size]
+        dist = (query ** 2).sum(dim=1, keepdim=True) + train_sq[None, :] - 2 * query @ train_hidden.t()
+        idx = dist.topk(k, dim=1, largest=False).indices
+        predicts.append((target[idx].mean(dim=1) >= 0.5).long())
+    return torch.cat(predicts)
+
+
+def attack_metrics(predicts, target, names=AUX_NAMES):
+    """
+    Returns {attribute: (accuracy, f1)} in percent for binary predictions of shape (n, n_attributes)
+    """
+    predicts, target = predicts.long().cpu(), target.long().cpu()
+    metrics = {}
+    for j in range(target.shape[1]):
+        p, t = predicts[:, j], target[:, j]
+        tp = ((p == 1) & (t == 1)).sum().item()
+        wrong = (p != t).sum().item()
+        acc = 1 - wrong / len(t)
+        f1 = 2 * tp / max(2 * tp + wrong, 1)
+        name = names[j] if j < len(names) else str(j)
+        metrics[name] = (round(acc * 100, 3), round(f1 * 100, 3))
+    return metrics
+
+
+def train_attack_zoo(train_hidden, train_target, val_hidden, val_target,
+                     widths=(50, 100, 200), k=10, epochs=20, batch_size=256, lr=1e-3, return_attackers=False):
+    """
+    Trains all attackers on the same cached representations and evaluates them on the validation ones.
+
+    Args:
+        train_hidden, val_hidden (Tensor): r(x), shape (n, hidden_size)
+        train_target, val_target (Tensor): aux bitmasks, shape (n, n_attributes)
+        widths (tuple): Hidden layer widths of the MLP attackers
+        k (int): Number of neighbours of the kNN attacker
+        return_attackers (bool): Also return the trained attackers, to evaluate them on other splits
+    Returns:
+        {attacker name: {attribute: (accuracy, f1)}}, and with return_attackers a list of callables
+        r(x) -> {attacker name: binary predictions}
+    """
+    # standardize with training statistics, the attackers are scale sensitive
+    mean, std = train_hidden.mean(dim=0), train_hidden.std(dim=0).clamp(min=1e-6)
+    train_hidden = (train_hidden - mean) / std
+    val_hidden = (val_hidden - mean) / std
+
+    hidden_size, output_size = train_hidden.shape[1], train_target.shape[1]
+    device = train_hidden.device
+    logistic = nn.Linear(hidden_size, output_size).to(device)
+    mlps = BatchedMLPAttacker(hidden_size, widths, output_size).to(device)
+    optimizer = optim.Adam(list(logistic.parameters()) + list(mlps.parameters()), lr=lr)
+    loss_function = nn.BCEWithLogitsLoss()
+
+    for epoch in range(epochs):
+        perm = torch.randperm(len(train_hidden), device=device)
+        for start in range(0, len(perm), batch_size):
+            idx = perm[start:start + batch_size]
+            hidden_state, target = train_hidden[idx], train_target[idx]
+            loss = loss_function(logistic(hidden_state), target.float()) + mlps.get_loss(hidden_state, target)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+    results = {}
+    with torch.no_grad():
+        results["logistic"] = attack_metrics((logistic(val_hidden) >= 0).long(), val_target)
+        for width, predicts in zip(widths, mlps.get_prediction(val_hidden)):
+            results[f"mlp-{width}"] = attack_metrics(predicts, val_target)
+        results[f"knn-{k}"] = attack_metrics(knn_predict(train_hidden, train_target, val_hidden, k=k), val_target)
+    if not return_attackers:
+        return results
+
+    standardize = lambda hidden_state: (hidden_state - mean) / std
+    attackers = [
+        lambda h: {"logistic": (logistic(standardize(h)) >= 0).long()},
+        lambda h: {f"mlp-{width}": p for width, p in zip(widths, mlps.get_prediction(standardize(h)))},
+        lambda h: {f"knn-{k}": knn_predict(train_hidden, train_target, standardize(h), k=k)},
+    ]
+    return results, attackers
+
+
+def print_attack_zoo(results, elapsed=None):
+    for name, metrics in results.items():
+        report = ", ".join(f"{attr} acc: {acc}%, f1: {f1}%" for attr, (acc, f1) in metrics.items())
+        print(f"[zoo {name}] {report}")
+    attributes = next(iter(results.values())).keys()
+    bound = ", ".join(f"{attr} acc: {max(m[attr][0] for m in results.values())}%" for attr in attributes)
+    print(f"[zoo upper bound] {bound}")
+    if elapsed is not None:
+        print(f"[zoo] {elapsed:.2f}s")
+
+
+def run_attack_zoo(train_hidden, train_target, val_hidden, val_target, **kwargs):
+    start = time.perf_counter()
+    results = train_attack_zoo(train_hidden, train_target, val_hidden, val_target, **kwargs)
+    print_attack_zoo(results[0] if kwargs.get("return_attackers") else results, time.perf_counter() - start)
+    return results
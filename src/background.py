@@ -0,0 +1,171 @@
+"""
+Validation and checkpoint writing off the training thread.
+
+Validator evaluates weight snapshots, either inline or on a replica of the model in a background
+worker thread while the next epoch trains, and keeps track of the best snapshot as results arrive.
+CheckpointWriter serializes checkpoints from a queue in a background thread.
+"""
+import os
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from .execution import eager_copy
+
+
+def clone_state(obj):
+    """
+    Detached copy of every tensor in a (nested) state dict, safe to hand to another thread
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().clone()
+    if isinstance(obj, dict):
+        return {k: clone_state(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(clone_state(v) for v in obj)
+    return obj
+
+
+def rng_state():
+    """
+    State of the python, numpy and torch (CPU and CUDA) generators, so a resumed run continues the
+    same data order and sampling instead of replaying the first epoch
+    """
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    state = {"python": random.getstate(), "numpy": (name, torch.from_numpy(keys.astype(np.int64)), pos, has_gauss, cached),
+             "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    name, keys, pos, has_gauss, cached = state["numpy"]
+    random.setstate(state["python"])
+    np.random.set_state((name, keys.cpu().numpy().astype(np.uint32), pos, has_gauss, cached))
+    torch.set_rng_state(state["torch"].cpu())
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state["cuda"]])
+
+
+class CheckpointWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        # first failed write, re-raised by close()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, obj, path):
+        """
+        Queues obj to be written to path; obj must not be modified afterwards (see clone_state)
+        """
+        self.queue.put((obj, path))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            obj, path = item
+            try:
+                # write then rename, so a crash never leaves a truncated checkpoint behind
+                torch.save(obj, path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                print(f"[checkpoint] failed to write {path}: {e}")
+                if self.error is None:
+                    self.error = e
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Validator:
+    def __init__(self, model, evaluate, log, asynchronous=False, writer=None, best_path=None, criterion=None):
+        """
+        Args:
+            model (nn.Module): Model being trained, used to build the replica evaluated in the background
+            evaluate (callable): evaluate(model) -> (loss, *metrics)
+            log (callable): log(epoch, result) prints a validation result
+            criterion (callable): criterion(result) -> value to minimize for best-model selection, [default=loss]
+            asynchronous (bool): Evaluate in a background thread instead of inline
+            writer (CheckpointWriter): Also writes the best snapshot to best_path when set
+        """
+        self.evaluate = evaluate
+        self.log = log
+        self.criterion = criterion
+        self.writer = writer
+        self.best_path = best_path
+        self.executor = ThreadPoolExecutor(max_workers=1) if asynchronous else None
+        self.replica = eager_copy(model) if asynchronous else None
+        self.pending = []
+
+        self.best_score = float("inf")
+        self.best_epoch = None
+        self.best_state = None
+        self.best_result = None
+
+    def restore(self, path, map_location=None):
+        """
+        Resumes best-model selection from the best snapshot a previous run wrote to `path`
+        """
+        if path is None or not os.path.exists(path):
+            return
+        checkpoint = torch.load(path, map_location=map_location)
+        result = tuple(checkpoint["result"])
+        self.best_score = result[0] if self.criterion is None else self.criterion(result)
+        self.best_epoch, self.best_state, self.best_result = checkpoint["epoch"], checkpoint["model"], result
+
+    def submit(self, epoch, state, model):
+        """
+        Validates the snapshot `state` of `model` taken at the end of `epoch`
+        """
+        if self.executor is None:
+            self._reconcile(epoch, state, self.evaluate(model))
+        else:
+            self.pending.append(self.executor.submit(self._run, epoch, state))
+            self.poll()
+
+    def _run(self, epoch, state):
+        self.replica.load_state_dict(state)
+        return epoch, state, self.evaluate(self.replica)
+
+    def poll(self, wait=False):
+        """
+        Reconciles the results that arrived, in epoch order
+        """
+        while self.pending and (wait or self.pending[0].done()):
+            self._reconcile(*self.pending.pop(0).result())
+
+    def _reconcile(self, epoch, state, result):
+        self.log(epoch, result)
+        score = result[0] if self.criterion is None else self.criterion(result)
+        if score < self.best_score:
+            self.best_score, self.best_epoch, self.best_state, self.best_result = score, epoch, state, result
+            print('[best_model updated]')
+            if self.writer is not None and self.best_path is not None:
+                self.writer.save({"epoch": epoch, "model": state, "result": result}, self.best_path)
+
+    def load_best(self, model):
+        """
+        Loads the best snapshot into `model` and returns its result. When no epoch was validated (e.g.
+        --iterations 0, or a resumed run already at its budget without best snapshot), `model` keeps
+        its current weights, which are evaluated instead.
+        """
+        if self.best_state is None:
+            return self.evaluate(model)
+        model.load_state_dict(self.best_state)
+        return self.best_result
+
+    def close(self):
+        self.poll(wait=True)
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,151 @@
+"""
+Benchmarks configurations on one dataset: training time next to task accuracy and attacker
+accuracy, so speedups can be weighed against utility and privacy shifts.
+
+    python -m src.benchmark tp_us -i 2 --bench precision   # fp32/bf16 x eager/torch.compile
+    python -m src.benchmark tp_us -i 2 --bench encoder     # every registered encoder
+    python -m src.benchmark tp_us --bench memory           # BiLSTM peak memory vs. seq_len (no data needed)
+    python -m src.benchmark tp_us --bench startup          # import / --help time of src.main (no data needed)
+"""
+import copy
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from .main import get_parser, setup_device, load_data, build_model
+from .models.encoders import ENCODERS
+from .models.attacker import MainClassifier
+
+
+BENCHMARKS = {
+    "precision": [{"precision": "fp32", "compile": False}, {"precision": "bf16", "compile": False},
+                  {"precision": "fp32", "compile": True}, {"precision": "bf16", "compile": True}],
+    "encoder": [{"encoder": name} for name in ENCODERS],
+    "startup": [],
+    "memory": [{"lstm_checkpoint_chunk": 0, "tbptt_chunk": 0}, {"lstm_checkpoint_chunk": 100, "tbptt_chunk": 0},
+               {"lstm_checkpoint_chunk": 0, "tbptt_chunk": 100}],
+}
+
+
+def run_config(args, train, dev, config):
+    args = copy.copy(args)
+    for key, value in config.items():
+        setattr(args, key, value)
+    random.seed(10)
+    np.random.seed(10)
+    torch.manual_seed(0)
+
+    mod = build_model(args, train)
+    start = time.perf_counter()
+    acc = mod.train_main(train, dev)
+    main_time = time.perf_counter() - start
+    start = time.perf_counter()
+    gender_acc, age_acc = mod.train_adversarial(train, dev)
+    adversarial_time = time.perf_counter() - start
+    return main_time, adversarial_time, acc, gender_acc, age_acc
+
+
+def config_name(config):
+    return ",".join(f"{k}={v}" for k, v in config.items())
+
+
+def measure_step(args, config, queue, vocab_size=10000, output_size=5):
+    """
+    Peak memory and time of one training step of the BiLSTM on random word ids.
+    Runs in a fresh process so that ru_maxrss only reflects this configuration.
+    """
+    args = copy.copy(args)
+    for key, value in config.items():
+        setattr(args, key, value)
+    torch.manual_seed(0)
+    model = MainClassifier(alphabet_size=1, vocab_size=vocab_size, output_size=output_size, args=args).to(args.device)
+    model.train()
+    input_vec = torch.randint(5, vocab_size, (args.batch_size, args.seq_len), device=args.device)
+    target = torch.randint(0, output_size, (args.batch_size, 1), device=args.device)
+
+    if args.device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(args.device)
+        base = torch.cuda.memory_allocated(args.device)
+    else:
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    start = time.perf_counter()
+    loss, predicts = model.get_loss_prediction(input_vec, target)
+    loss.backward()
+    elapsed = time.perf_counter() - start
+    if args.device.type == "cuda":
+        peak = torch.cuda.max_memory_allocated(args.device) - base
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - base
+    queue.put((peak, elapsed))
+
+
+def bench_memory(args, seq_lens=(75, 250, 500, 1000, 2000)):
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'config':<44}  seq_len  peak memory     time")
+    for config in BENCHMARKS["memory"]:
+        for seq_len in seq_lens:
+            queue = ctx.Queue()
+            process = ctx.Process(target=measure_step, args=(args, dict(config, seq_len=seq_len, encoder="bilstm"), queue))
+            process.start()
+            peak, elapsed = queue.get()
+            process.join()
+            print(f"{config_name(config):<44}  {seq_len:7d}  {peak / 2 ** 20:8.1f} MiB  {elapsed:6.2f}s")
+
+
+OPTIONAL_MODULES = ["pyvacy", "pytorch_influence_functions", "sklearn", "tqdm"]
+
+
+def bench_startup(repeats=5):
+    """
+    Wall time of importing src.main and of `src.main --help` in fresh interpreters, and the optional
+    dependencies that got imported although no flag asked for them
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = {
+        "import src.main": [sys.executable, "-c", "import src.main"],
+        "src.main --help": [sys.executable, "-m", "src.main", "--help"],
+    }
+    for name, command in commands.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        print(f"[startup] {name:<16} min: {min(times):.3f}s, median: {statistics.median(times):.3f}s")
+
+    check = f"import sys, src.main; print(','.join(m for m in {OPTIONAL_MODULES!r} if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, "-c", check], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    print(f"[startup] optional modules imported by src.main: {loaded or 'none'}")
+
+
+def main(args):
+    if args.bench == "startup":
+        return bench_startup()
+    setup_device(args)
+    if args.bench == "memory":
+        return bench_memory(args)
+    train, dev, test = load_data(args)
+
+    configs = BENCHMARKS[args.bench]
+    results = [run_config(args, train, dev, config) for config in configs]
+
+    base_main, base_adv, base_acc, base_gender, base_age = results[0]
+    print(f"{'config':<32}  main time  speedup  adv time  speedup  acc (diff)        gender acc (diff)  age acc (diff)")
+    for config, (t_main, t_adv, acc, gender_acc, age_acc) in zip(configs, results):
+        print(f"{config_name(config):<32}  {t_main:8.1f}s  {base_main / t_main:6.2f}x  {t_adv:7.1f}s  {base_adv / t_adv:6.2f}x"
+              f"  {acc:6.2f} ({acc - base_acc:+.2f})   {gender_acc:6.2f} ({gender_acc - base_gender:+.2f})"
+              f"    {age_acc:6.2f} ({age_acc - base_age:+.2f})")
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--bench", default="precision", choices=list(BENCHMARKS), help="Configurations to compare")
+    main(parser.parse_args())
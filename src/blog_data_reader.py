@@ -0,0 +1,53 @@
+"""
+Blog authorship corpus: one file per blogger, named {user_id}.{gender}.{age}.{industry}.{sign}.xml
+
+<Blog>
+<date>31,May,2004</date>
+<post>
+       Dear Susan, ...
+</post>
+...
+</Blog>
+
+The files are not well-formed XML (raw & and <, latin-1 text), so posts are matched with a regex.
+Ages come in three disjoint bands (13-17, 23-27, 33-48): BIRTH is set below 30.
+"""
+import os
+import re
+
+from .tp_data_reader import GENDER, BIRTH
+
+POST = re.compile(r"<post>(.*?)</post>", re.S)
+
+
+def read_blogs(directory):
+    """
+    Yields (post, metadata, user_id), reading one blogger file at a time
+    """
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".xml"):
+            continue
+        user_id, gender, age = filename.split(".")[:3]
+        meta = set()
+        if gender == "female":
+            meta.add(GENDER)
+        if int(age) < 30:
+            meta.add(BIRTH)
+        with open(os.path.join(directory, filename), encoding="latin-1") as f:
+            text = f.read()
+        for post in POST.findall(text):
+            post = " ".join(post.split())
+            if post:
+                yield post, meta, user_id
+
+
+def count_posts(directory):
+    """
+    Number of non-empty posts read_blogs yields, without building them
+    """
+    n = 0
+    for filename in os.listdir(directory):
+        if filename.endswith(".xml"):
+            with open(os.path.join(directory, filename), encoding="latin-1") as f:
+                n += sum(1 for post in POST.findall(f.read()) if post.split())
+    return n
@@ -0,0 +1,124 @@
+"""
+Bootstrap confidence intervals and paired-bootstrap significance over per-example correctness.
+
+All metrics of a split (task, gender and age correctness) are resampled together. A resampled mean
+only depends on how many times each distinct column of the (k, n) correctness matrix is drawn, and
+with binary metrics there are at most 2^k of them: the counts are drawn directly from their
+multinomial distribution (a chain of binomials over all resamples at once), which is the same
+distribution as counting over an (n_resamples, n) index matrix at a fraction of the cost. Other
+values fall back to the index matrix, drawn with one torch.randint per block of resamples.
+
+    python -m src.bootstrap run_a.pt run_b.pt    # paired bootstrap of two --correctness-out files
+"""
+import argparse
+
+import torch
+
+
+def resample_counts(codes, n_patterns, n_resamples, generator=None):
+    """
+    Number of draws of each pattern in n_resamples resamples with replacement of `codes`,
+    shape (n_resamples, n_patterns)
+    """
+    n = len(codes)
+    freqs = torch.bincount(codes, minlength=n_patterns).double() / n
+    remaining = torch.full((n_resamples,), float(n), dtype=torch.float64)
+    left = 1.0
+    counts = []
+    for p in freqs.tolist()[:-1]:
+        prob = torch.full_like(remaining, min(p / left, 1.0) if left > 0 else 0.0)
+        count = torch.binomial(remaining, prob, generator=generator)
+        counts.append(count)
+        remaining = remaining - count
+        left -= p
+    counts.append(remaining)
+    return torch.stack(counts, dim=1)
+
+
+def bootstrap_means(correct, n_resamples=10000, seed=0, max_elements=1 << 26, max_patterns=256):
+    """
+    Args:
+        correct (Tensor): Correctness of shape (n,) or (k, n), one row per metric
+        max_elements (int): Bound on the size of one block of the index matrix
+        max_patterns (int): Above this number of distinct columns, resample with the index matrix
+
+    Returns:
+        Tensor: Resampled means of shape (k, n_resamples)
+    """
+    correct = correct.reshape(-1, correct.shape[-1]).float()
+    n = correct.shape[1]
+    patterns, codes = torch.unique(correct.cpu(), dim=1, return_inverse=True)
+    if patterns.shape[1] <= max_patterns:
+        generator = torch.Generator().manual_seed(seed)
+        counts = resample_counts(codes, patterns.shape[1], n_resamples, generator)
+        return (patterns.double() @ counts.t() / n).float().to(correct.device)
+
+    generator = torch.Generator(device=correct.device).manual_seed(seed)
+    block = max(1, max_elements // n)
+    means = []
+    for start in range(0, n_resamples, block):
+        rows = min(block, n_resamples - start)
+        index = torch.randint(n, (rows, n), generator=generator, device=correct.device)
+        # (k, rows, n) -> (k, rows)
+        means.append(correct[:, index].mean(dim=2))
+    return torch.cat(means, dim=1)
+
+
+def confidence_interval(correct, n_resamples=10000, alpha=0.05, seed=0):
+    """
+    Percentile bootstrap interval of the accuracy of each row of `correct`.
+
+    Returns:
+        list: (acc, low, high) per metric, in %
+    """
+    correct = correct.reshape(-1, correct.shape[-1]).float()
+    means = bootstrap_means(correct, n_resamples, seed)
+    q = torch.tensor([alpha / 2, 1 - alpha / 2], device=means.device)
+    bounds = torch.quantile(means, q, dim=1)
+    acc = correct.mean(dim=1)
+    return [(round(a * 100, 3), round(lo * 100, 3), round(hi * 100, 3))
+            for a, lo, hi in zip(acc.tolist(), bounds[0].tolist(), bounds[1].tolist())]
+
+
+def paired_bootstrap(correct_a, correct_b, n_resamples=10000, alpha=0.05, seed=0):
+    """
+    Paired bootstrap of the accuracy difference a - b on the same examples (the same resamples for both).
+
+    Returns:
+        list: (difference, low, high, p-value) per metric, in % (the p-value is two-sided)
+    """
+    diff = correct_a.reshape(-1, correct_a.shape[-1]).float() - correct_b.reshape(-1, correct_b.shape[-1]).float()
+    means = bootstrap_means(diff, n_resamples, seed)
+    q = torch.tensor([alpha / 2, 1 - alpha / 2], device=means.device)
+    bounds = torch.quantile(means, q, dim=1)
+    delta = diff.mean(dim=1)
+    # resampled differences centered on the observed one, as far from it as it is from 0
+    p = ((means - delta[:, None]).abs() >= delta.abs()[:, None]).float().mean(dim=1)
+    return [(round(d * 100, 3), round(lo * 100, 3), round(hi * 100, 3), p_value)
+            for d, lo, hi, p_value in zip(delta.tolist(), bounds[0].tolist(), bounds[1].tolist(), p.tolist())]
+
+
+def print_intervals(names, intervals, alpha=0.05):
+    for name, (acc, low, high) in zip(names, intervals):
+        print(f"  {name}: {acc}% [{low}, {high}] ({(1 - alpha) * 100:g}% CI)")
+
+
+def print_paired(names, results, alpha=0.05):
+    for name, (diff, low, high, p) in zip(names, results):
+        print(f"  {name}: {diff:+}% [{low}, {high}] ({(1 - alpha) * 100:g}% CI), p={p:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paired bootstrap between the correctness vectors of two runs")
+    parser.add_argument("run_a", type=str, help="--correctness-out file of the first run")
+    parser.add_argument("run_b", type=str, help="--correctness-out file of the second run")
+    parser.add_argument("--resamples", type=int, default=10000, help="Bootstrap resamples")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Confidence level is 1 - alpha")
+    args = parser.parse_args()
+
+    a, b = torch.load(args.run_a), torch.load(args.run_b)
+    for split in sorted(set(a) & set(b)):
+        if a[split]["correct"].shape != b[split]["correct"].shape:
+            raise ValueError(f"{split}: the runs were evaluated on different examples")
+        print(f"{split}: {args.run_a} - {args.run_b}")
+        print_paired(a[split]["names"], paired_bootstrap(a[split]["correct"], b[split]["correct"], args.resamples, args.alpha), args.alpha)
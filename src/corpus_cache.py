@@ -0,0 +1,151 @@
+"""
+Append-only cache of tokenized splits and of the vocabulary.
+
+Each split is a JSON-lines file of tokenized examples plus a binary index of line offsets
+({split}.idx, int64), so examples can be appended and sampled without reading the whole split.
+The vocabulary is kept in word-id order, so ids stay stable when new words are appended.
+"""
+import json
+import os
+import random
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+from .example import Example
+from .vocabulary import Vocabulary
+
+
+SPLITS = ["train", "dev", "test"]
+
+
+class CorpusCache:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return all(os.path.exists(self._path(f"{split}.jsonl")) for split in SPLITS)
+
+    def write(self, splits, meta=None):
+        """
+        Args:
+            splits (dict): split name -> list of Examples
+            meta (dict): Extra information stored with the cache (e.g. output sizes)
+        """
+        for split, examples in splits.items():
+            self.remove(split)
+            self.append(split, examples)
+        if meta is not None:
+            with open(self._path("meta.json"), "w") as f:
+                json.dump(meta, f)
+
+    def meta(self):
+        with open(self._path("meta.json")) as f:
+            return json.load(f)
+
+    def remove(self, split):
+        for suffix in [".jsonl", ".idx"]:
+            if os.path.exists(self._path(split + suffix)):
+                os.remove(self._path(split + suffix))
+
+    def append(self, split, examples):
+        offsets = array("q")
+        with open(self._path(f"{split}.jsonl"), "ab") as f:
+            for ex in examples:
+                offsets.append(f.tell())
+                line = {"tokens": ex.get_sentence(), "label": ex.get_label(), "aux": sorted(ex.get_aux_labels()),
+                        "user": ex.get_user_id()}
+                f.write((json.dumps(line) + "\n").encode("utf-8"))
+        with open(self._path(f"{split}.idx"), "ab") as f:
+            offsets.tofile(f)
+
+    def size(self, split):
+        return os.path.getsize(self._path(f"{split}.idx")) // 8
+
+    @staticmethod
+    def _example(line):
+        obj = json.loads(line)
+        return Example.from_tokens(obj["tokens"], obj["label"], metadata=set(obj["aux"]), user_id=obj.get("user"))
+
+    def iterate(self, split):
+        with open(self._path(f"{split}.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                yield self._example(line)
+
+    def load(self, split):
+        return list(self.iterate(split))
+
+    def split(self, split):
+        """
+        The split as a read-only sequence that stays on disk (see CachedSplit)
+        """
+        return CachedSplit(self, split)
+
+    def sample(self, split, n, upto=None, seed=0):
+        """
+        n random examples among the first `upto` of the split, read through the offset index
+        """
+        upto = self.size(split) if upto is None else upto
+        rows = sorted(random.Random(seed).sample(range(upto), min(n, upto)))
+        offsets = array("q")
+        with open(self._path(f"{split}.idx"), "rb") as f:
+            offsets.fromfile(f, upto)
+        examples = []
+        with open(self._path(f"{split}.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(offsets[row])
+                examples.append(self._example(f.readline().decode("utf-8")))
+        return examples
+
+    def has_vocabulary(self):
+        return os.path.exists(self._path("vocabulary_words")) and os.path.exists(self._path("vocabulary_freqs.json"))
+
+    def save_vocabulary(self, vocabulary):
+        vocabulary.save(self._path("vocabulary"))
+        with open(self._path("vocabulary_freqs.json"), "w") as f:
+            json.dump(dict(vocabulary.word_freqs), f)
+
+    def load_vocabulary(self):
+        with open(self._path("vocabulary_freqs.json")) as f:
+            vocabulary = Vocabulary(json.load(f))
+        vocabulary.load(self._path("vocabulary"))
+        return vocabulary
+
+
+class CachedSplit(Sequence):
+    """
+    Examples of a cached split, parsed when they are accessed: iteration streams the JSON lines and
+    indexing seeks through the memory-mapped offset index, so memory does not grow with the split.
+    The view covers the examples the split had when it was created.
+    """
+
+    def __init__(self, cache, split):
+        self.cache = cache
+        self.name = split
+        path = cache._path(f"{split}.idx")
+        self.offsets = np.memmap(path, dtype=np.int64, mode="r") if os.path.getsize(path) > 0 else np.zeros(0, dtype=np.int64)
+        self._file = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if self._file is None:
+            self._file = open(self.cache._path(f"{self.name}.jsonl"), "rb")
+        self._file.seek(int(self.offsets[index]))
+        return CorpusCache._example(self._file.readline().decode("utf-8"))
+
+    def __iter__(self):
+        for _, example in zip(range(len(self)), self.cache.iterate(self.name)):
+            yield example
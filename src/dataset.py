@@ -3,7 +3,6 @@ from torch.utils.data import Dataset
 from typing import List
 from .example import Example
 from .vocabulary import Vocabulary
-from sklearn.utils import shuffle
 
 
 # class PrDataset:
@@ -60,8 +59,16 @@ class PrDataset(Dataset):
         return len(self.dataset)
 
     def shuffle(self):
+        from sklearn.utils import shuffle
         self.dataset = shuffle(self.dataset)
 
+    def tensors(self):
+        """
+        Encodes the whole split once and returns the stacked tensors (input_vec, [aux,] target)
+        """
+        items = [self[i] for i in range(len(self))]
+        return tuple(torch.stack(t) for t in zip(*items))
+
 class AttackDataset(Dataset):
     def __init__(self, examples: List[Example], voc: Vocabulary, seq_len, output_size) -> None:
         super().__init__()
@@ -88,6 +95,7 @@ class AttackDataset(Dataset):
         return len(self.dataset)
 
     def shuffle(self):
+        from sklearn.utils import shuffle
         self.dataset = shuffle(self.dataset)
 
 # class PrDataLoader:
@@ -0,0 +1,130 @@
+"""
+Near-duplicate detection across the train/dev/test splits with MinHash and LSH banding.
+
+Each review is reduced to a MinHash signature over its word shingles, and the signature is cut into
+bands that are hashed into buckets. Only reviews sharing a bucket are compared, so the pass is
+near-linear in the corpus size instead of quadratic. Splits are indexed in priority order
+(test, dev, train): a review that near-duplicates one of a higher-priority split is flagged, and
+removed from its own split, so the evaluation splits are never shrunk to clean the training split.
+"""
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+
+PRIORITY = ["test", "dev", "train"]
+_PRIME = (1 << 31) - 1
+
+
+def group_by_user(splits):
+    """
+    Moves all reviews of a user to the same split (10% test, 10% dev, 80% train, as get_dataset),
+    chosen from a hash of the user_id. Reviews without a user_id keep their split.
+    """
+    grouped = {split: [] for split in splits}
+    for split, examples in splits.items():
+        for ex in examples:
+            user_id = ex.get_user_id()
+            if user_id is not None:
+                bucket = zlib.crc32(str(user_id).encode("utf-8")) % 10
+                split = PRIORITY[min(bucket, 2)]
+            grouped[split].append(ex)
+    return grouped
+
+
+class MinHashLSH:
+    def __init__(self, num_perm=128, bands=32, shingle_size=3, threshold=0.8, seed=0):
+        """
+        Args:
+            num_perm (int): Length of the MinHash signatures
+            bands (int): LSH bands, num_perm must be a multiple of it
+            shingle_size (int): Words per shingle
+            threshold (float): Estimated Jaccard similarity above which two reviews are duplicates
+        """
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+        self.signatures = []
+        self.keys = []
+
+    def signature(self, tokens):
+        tokens = [t.lower() for t in tokens]
+        n = max(len(tokens) - self.shingle_size + 1, 1)
+        shingles = {" ".join(tokens[i:i + self.shingle_size]) for i in range(n)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles)) % _PRIME
+        # all permutations at once: (a * h + b) mod p, then min over the shingles
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature, accept=None):
+        """
+        First indexed key whose signature agrees with `signature` on at least threshold of the
+        positions, among the keys for which accept(key) holds. None if there is none.
+        """
+        seen = set()
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            for row in band.get(key, ()):
+                if row in seen or (accept is not None and not accept(self.keys[row])):
+                    continue
+                seen.add(row)
+                if (self.signatures[row] == signature).mean() >= self.threshold:
+                    return self.keys[row]
+        return None
+
+    def insert(self, key, signature):
+        row = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band, band_key in zip(self.buckets, self._band_keys(signature)):
+            band[band_key].append(row)
+
+
+def deduplicate(splits, remove=True, user_groups=False, num_perm=128, bands=32, shingle_size=3, threshold=0.8, seed=0):
+    """
+    Args:
+        splits (dict): split name -> list of Examples
+        remove (bool): Drop the flagged reviews, otherwise only report them
+        user_groups (bool): Group the splits by user_id first (see group_by_user)
+
+    Returns:
+        (dict, dict): split name -> kept Examples, and (split, duplicated split) -> number of pairs
+    """
+    if user_groups:
+        splits = group_by_user(splits)
+    index = MinHashLSH(num_perm, bands, shingle_size, threshold, seed)
+    pairs = defaultdict(int)
+    kept = {}
+    for split in [s for s in PRIORITY if s in splits]:
+        kept[split] = []
+        for i, ex in enumerate(splits[split]):
+            signature = index.signature(ex.get_sentence())
+            match = index.query(signature, accept=lambda key: key[0] != split)
+            if match is not None:
+                pairs[(split, match[0])] += 1
+                if remove:
+                    continue
+            index.insert((split, i), signature)
+            kept[split].append(ex)
+    return kept, dict(pairs)
+
+
+def print_dedup_report(kept, pairs, remove=True):
+    print("near-duplicates across splits:")
+    for (split, other), count in sorted(pairs.items()):
+        print(f"  {split} ~ {other}: {count} pairs")
+    for split, examples in kept.items():
+        duplicates = sum(count for (s, _), count in pairs.items() if s == split)
+        if remove:
+            print(f"  {split}: {len(examples) + duplicates} -> {len(examples)} ({duplicates} removed)")
+        else:
+            print(f"  {split}: {len(examples)} ({duplicates} flagged)")
@@ -0,0 +1,64 @@
+"""
+Subsampling of pre-encoded training tensors for DP training, and the matching privacy accountant.
+"""
+import torch
+
+from .dp_accounting import epsilon_table, SCHEMES
+
+
+class SubsampledLoader:
+    """
+    Yields `steps` minibatches drawn directly from pre-encoded tensors of a split.
+
+    poisson: every example is included independently with probability batch_size / n,
+             so batch sizes vary around batch_size.
+    uniform: batch_size examples drawn without replacement at every step.
+    """
+
+    def __init__(self, tensors, batch_size, steps, scheme="poisson", generator=None):
+        """
+        Args:
+            tensors (tuple): Encoded split, e.g. (input_vec, aux, target), sharing their first dimension
+            batch_size (int): (Expected) minibatch size
+            steps (int): Number of minibatches yielded per iteration over the loader
+            scheme (str): "poisson" or "uniform"
+            generator (torch.Generator): Source of randomness
+        """
+        assert scheme in SCHEMES, f"unknown sampling scheme {scheme}"
+        self.tensors = tensors
+        self.n = len(tensors[0])
+        self.batch_size = min(batch_size, self.n)
+        self.steps = steps
+        self.scheme = scheme
+        self.generator = generator
+
+    @property
+    def sampling_rate(self):
+        return self.batch_size / self.n
+
+    def sample_indices(self):
+        if self.scheme == "poisson":
+            mask = torch.rand(self.n, generator=self.generator) < self.sampling_rate
+            return mask.nonzero(as_tuple=True)[0]
+        return torch.randperm(self.n, generator=self.generator)[:self.batch_size]
+
+    def __len__(self):
+        return self.steps
+
+    def __iter__(self):
+        for _ in range(self.steps):
+            idx = self.sample_indices()
+            yield tuple(t[idx] for t in self.tensors)
+
+
+def epsilon(n, batch_size, noise_multiplier, steps, delta, scheme="poisson"):
+    """
+    Epsilon spent after `steps` subsampled Gaussian steps, by the RDP accountant of dp_accounting
+    (the one solve_noise_multiplier inverts, so a --target-epsilon run reports its target).
+
+    poisson: RDP of the sampled Gaussian mechanism, for sampling rate batch_size / n.
+    uniform: RDP bound of Wang et al. (2019) for sampling without replacement, where neighbouring
+             datasets differ by a replaced example (see dp_accounting.compute_rdp_uniform).
+    """
+    assert scheme in SCHEMES, f"unknown sampling scheme {scheme}"
+    return float(epsilon_table([noise_multiplier], [batch_size / n], [steps], [delta], scheme=scheme)[0, 0, 0, 0])
@@ -1,15 +1,29 @@
 
-import nltk.tokenize as tokenizer
+from .tokenizer import nltk_tokenize
 
 
 class Example:
-    def __init__(self, sentence, label, metadata = None):
+    def __init__(self, sentence, label, metadata = None, user_id = None, tokenize = nltk_tokenize):
         self.sentence = sentence
         self.label = label
         
-        self.p_sentence = tokenizer.word_tokenize(sentence)
+        self.p_sentence = tokenize(sentence)
         
         self.metadata = metadata
+        self.user_id = user_id
+
+    @classmethod
+    def from_tokens(cls, tokens, label, metadata=None, sentence=None, user_id=None):
+        """
+        Rebuilds an already tokenized example without running the tokenizer again
+        """
+        example = cls.__new__(cls)
+        example.sentence = " ".join(tokens) if sentence is None else sentence
+        example.label = label
+        example.p_sentence = tokens
+        example.metadata = metadata
+        example.user_id = user_id
+        return example
     
     def get_label(self):
         return self.label
@@ -19,6 +33,9 @@ class Example:
     
     def get_aux_labels(self):
         return self.metadata
+
+    def get_user_id(self):
+        return self.user_id
     
     def get_training_example(self):
         return self.p_sentence, self.label
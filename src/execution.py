@@ -0,0 +1,47 @@
+"""
+Execution modes of the training and evaluation loops: bf16 autocast and torch.compile.
+"""
+import contextlib
+import copy
+
+import torch
+
+
+PRECISIONS = ["fp32", "bf16"]
+
+
+def autocast(device, precision="fp32"):
+    """
+    Context manager running the enclosed forward passes in bfloat16 when precision is "bf16".
+    The models keep their softmax/sigmoid outputs, and therefore the losses, in float32.
+    """
+    if precision == "fp32":
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+
+
+def compile_methods(module, *names):
+    """
+    Replaces the given methods of a module by their torch.compile'd version.
+    The module itself (parameters, state_dict, helper methods) is left untouched.
+    """
+    for name in names:
+        setattr(module, name, torch.compile(getattr(module, name)))
+    module.compiled_methods = getattr(module, "compiled_methods", []) + list(names)
+    return module
+
+
+def eager_copy(module):
+    """
+    Deep copy of a module without the compiled methods installed by compile_methods
+    """
+    compiled = {name: getattr(module, name) for name in getattr(module, "compiled_methods", [])}
+    for name in compiled:
+        delattr(module, name)
+    try:
+        replica = copy.deepcopy(module)
+        replica.compiled_methods = []
+        return replica
+    finally:
+        for name, fn in compiled.items():
+            setattr(module, name, fn)
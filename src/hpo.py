@@ -0,0 +1,152 @@
+"""
+Successive-halving hyperparameter search over PrModel configurations.
+
+Trials are sampled from SEARCH_SPACE and trained in parallel worker processes. At every rung each
+surviving trial is trained up to the rung's epoch budget and scored with
+
+    objective = task accuracy - leakage_weight * leakage
+
+where leakage is the mean over private attributes of the best attacker accuracy of a short
+attack_zoo run on r(x). The best 1/eta trials are promoted to the next rung, the rest are stopped.
+Trials checkpoint into their own directory (model, optimizer, defense and RNG states) and are
+resumed (--resume) when promoted, so they never restart from scratch.
+
+    python -m src.hpo tp_us -i 8 --trials 16 --eta 2 --min-epochs 1 --workers 4 --hpo-dir hpo/
+"""
+import copy
+import math
+import multiprocessing
+import os
+import random
+
+import numpy as np
+import torch
+
+from .main import get_parser, setup_device, load_data, build_model
+from .attack_zoo import train_attack_zoo
+
+
+SEARCH_SPACE = {
+    "learning_rate": lambda rng: 10 ** rng.uniform(-4, -2),
+    "word_hidden_dim": lambda rng: rng.choice([25, 50, 100]),
+    "fc_dim": lambda rng: rng.choice([25, 50, 100]),
+    "batch_size": lambda rng: rng.choice([64, 128, 256]),
+}
+
+# defense strength, only searched when the defense is enabled
+DEFENSE_SPACE = {
+    "atraining": ("adversary_weight", lambda rng: 10 ** rng.uniform(-1, 1)),
+    "ptraining": ("declustering_weight", lambda rng: 10 ** rng.uniform(-1, 1)),
+    "is_add_loss_noise": ("noise_scale", lambda rng: 10 ** rng.uniform(-2, 0)),
+    "is_add_raw_gradient_noise": ("noise_scale", lambda rng: 10 ** rng.uniform(-2, 0)),
+}
+
+
+def sample_config(args, rng):
+    config = {name: sample(rng) for name, sample in SEARCH_SPACE.items()}
+    for flag, (name, sample) in DEFENSE_SPACE.items():
+        if getattr(args, flag):
+            config[name] = sample(rng)
+    return config
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    return budgets + [max_epochs]
+
+
+# data and base arguments of a worker process, set once by init_worker
+WORKER = {}
+
+
+def init_worker(args):
+    torch.set_num_threads(max(1, args.threads_per_worker))
+    WORKER["args"] = args
+    WORKER["train"], WORKER["dev"], _ = load_data(args)
+
+
+def run_trial(trial_id, config, epochs):
+    """
+    Trains trial `trial_id` up to `epochs` epochs (resuming from its checkpoints) and scores it
+    """
+    args = copy.copy(WORKER["args"])
+    for key, value in config.items():
+        setattr(args, key, value)
+    args.iterations = epochs
+    args.checkpoint_dir = os.path.join(args.hpo_dir, f"trial{trial_id}")
+    args.resume = True
+    args.results_db = None
+    train, dev = WORKER["train"], WORKER["dev"]
+
+    # seeds the initialization; a promoted trial then restores the weights, defense state and RNG
+    # state of its last checkpoint, so the rung continues the data order where the previous one stopped
+    random.seed(10)
+    np.random.seed(10)
+    torch.manual_seed(0)
+    mod = build_model(args, train)
+    try:
+        acc = mod.train_main(train, dev)
+        train_hidden, train_target = mod.extract_representations(train)
+        val_hidden, val_target = mod.extract_representations(dev)
+        results = train_attack_zoo(train_hidden, train_target, val_hidden, val_target,
+                                   widths=(args.fc_dim,), k=args.knn_k, epochs=args.hpo_attacker_epochs,
+                                   batch_size=args.batch_size, lr=1e-3)
+    finally:
+        mod.close()
+    attributes = next(iter(results.values())).keys()
+    leakage = sum(max(m[attr][0] for m in results.values()) for attr in attributes) / len(attributes)
+    return trial_id, acc, leakage, acc - args.hpo_leakage_weight * leakage
+
+
+def successive_halving(args):
+    rng = random.Random(args.hpo_seed)
+    trials = {i: sample_config(args, rng) for i in range(args.trials)}
+    budgets = rung_budgets(args.min_epochs, args.iterations, args.eta)
+    os.makedirs(args.hpo_dir, exist_ok=True)
+
+    if args.shard_dir is not None:
+        # written once here, the trials only read them
+        mod = build_model(args, load_data(args)[0])
+        mod.training_shards()
+        mod.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    scores = {}
+    with ctx.Pool(args.workers, initializer=init_worker, initargs=(args,)) as pool:
+        alive = list(trials)
+        for rung, epochs in enumerate(budgets):
+            results = pool.starmap(run_trial, [(i, trials[i], epochs) for i in alive])
+            results.sort(key=lambda r: r[3], reverse=True)
+            print(f"[rung={rung} epochs={epochs}] {len(alive)} trials")
+            for trial_id, acc, leakage, objective in results:
+                scores[trial_id] = (epochs, acc, leakage, objective)
+                print(f"  [trial={trial_id}] acc: {acc}%, leakage: {leakage:.3f}%, objective: {objective:.3f}, config: {trials[trial_id]}")
+            if rung < len(budgets) - 1:
+                keep = max(1, math.ceil(len(results) / args.eta))
+                alive = [r[0] for r in results[:keep]]
+
+    best = max(alive, key=lambda i: scores[i][3])
+    epochs, acc, leakage, objective = scores[best]
+    print(f"[best trial={best}] epochs: {epochs}, acc: {acc}%, leakage: {leakage:.3f}%, objective: {objective:.3f}")
+    print(f"[best config] {trials[best]}")
+    return trials[best], scores[best]
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--trials", type=int, default=16, help="Number of sampled configurations")
+    parser.add_argument("--eta", type=int, default=2, help="1/eta of the trials are promoted at every rung")
+    parser.add_argument("--min-epochs", type=int, default=1, help="Epoch budget of the first rung; -i is the budget of the last one")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel worker processes")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="torch threads of each worker")
+    parser.add_argument("--hpo-dir", type=str, default="hpo", help="Directory of the trial checkpoints")
+    parser.add_argument("--hpo-leakage-weight", type=float, default=1.0, help="Weight of the leakage in the objective")
+    parser.add_argument("--hpo-attacker-epochs", type=int, default=5, help="Training epochs of the rung attackers")
+    parser.add_argument("--hpo-seed", type=int, default=0, help="Seed of the configuration sampler")
+    args = parser.parse_args()
+    setup_device(args)
+    successive_halving(args)
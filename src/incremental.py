@@ -0,0 +1,88 @@
+"""
+Incremental corpus update with warm-start fine-tuning.
+
+New reviews (raw Trustpilot jsonl) are tokenized and appended to the cached splits of --corpus-dir
+(10% test, 10% dev, 80% train, as get_dataset). Their unseen words get ids after the existing ones,
+word_embedding grows in place, and the main classifier resumes from the last checkpoint of
+--checkpoint-dir and is fine-tuned on the new training reviews plus a replay sample of older ones.
+Nothing here reads the whole corpus, so the cost scales with the update.
+
+    python -m src.incremental tp_us --corpus-dir cache/ --checkpoint-dir ckpt/ --new-reviews new.jsonl -i 2
+"""
+import os
+import random
+from collections import defaultdict
+
+import torch
+
+from .main import get_parser, setup_device, PrModel
+from .corpus_cache import CorpusCache
+from .tp_data_reader import get_raw_data, construct_examples
+
+
+def split_examples(examples, seed=10):
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    seg_size = len(examples) // 10
+    return {"test": examples[:seg_size], "dev": examples[seg_size:seg_size*2], "train": examples[seg_size*2:]}
+
+
+def word_freqs(examples):
+    freqs = defaultdict(int)
+    for example in examples:
+        for token in example.get_sentence():
+            freqs[token] += 1
+    return freqs
+
+
+def update(args):
+    cache = CorpusCache(args.corpus_dir)
+    if not cache.exists() or not cache.has_vocabulary():
+        raise FileNotFoundError(f"{args.corpus_dir} has no cached corpus: run src.main with --corpus-dir first")
+    last = os.path.join(args.checkpoint_dir, "main_last.pt")
+
+    # warm start: model over the current vocabulary, restored from the last checkpoint
+    meta = cache.meta()
+    vocabulary = cache.load_vocabulary()
+    args.pretrained_vectors = None
+    args.resume = False
+    # fine-tunes on the delta and the replay sample, not on the whole sharded split
+    args.shard_dir = None
+    mod = PrModel(args, vocabulary, meta["classifier_output_size"], meta["adversary_output_size"])
+    checkpoint = torch.load(last, map_location=mod.device)
+    mod.main_classifier.load_state_dict(checkpoint["model"])
+    print(f"[update] warm start from {last} (epoch={checkpoint['epoch']})")
+
+    # append the new reviews to the cached splits
+    old_sizes = {split: cache.size(split) for split in ["train", "dev", "test"]}
+    new = split_examples(construct_examples(get_raw_data(args.new_reviews), args.tokenizer))
+    for split, examples in new.items():
+        cache.append(split, examples)
+    print("[update] new examples: " + ", ".join(f"{split}: {len(examples)}" for split, examples in new.items()))
+
+    # new words get ids after the existing ones, the embedding grows to match
+    new_words = vocabulary.extend(word_freqs(new["train"]))
+    mod.main_classifier.grow_embedding(vocabulary.size_words())
+    cache.save_vocabulary(vocabulary)
+    print(f"[update] {len(new_words)} new words, vocabulary size: {vocabulary.size_words()}")
+
+    # fine-tune on the delta plus a replay sample of the previous training data
+    replay = cache.sample("train", args.replay_size, upto=old_sizes["train"])
+    dev = new["dev"] + cache.sample("dev", args.replay_size, upto=old_sizes["dev"])
+    try:
+        acc = mod.train_main(new["train"] + replay, dev)
+    finally:
+        mod.close()
+    return acc
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--new-reviews", type=str, required=True, help="Raw Trustpilot jsonl file of the new reviews")
+    parser.add_argument("--replay-size", type=int, default=5000, help="Older train (and dev) examples replayed with the update")
+    args = parser.parse_args()
+    if args.corpus_dir is None or args.checkpoint_dir is None:
+        parser.error("--corpus-dir and --checkpoint-dir are required")
+    setup_device(args)
+    torch.manual_seed(0)
+    update(args)
@@ -0,0 +1,175 @@
+"""
+Nearest-neighbor index over hidden representations r(x), for leakage and membership audits.
+
+Distances are computed block by block as ||q||^2 + ||x||^2 - 2 q.x (one matmul per block), so memory
+stays bounded by block_size x rows. With n_lists > 0 the rows are partitioned by k-means (IVF coarse
+quantization) and each query only scans the n_probe closest lists, for millions of rows.
+
+    python -m src.knn_index
+    (checks auc, ties included, against the pairwise count of member wins)
+"""
+import torch
+
+from .attack_zoo import attack_metrics
+
+
+def _sq_dist(queries, vectors, vectors_sq):
+    return ((queries ** 2).sum(dim=1, keepdim=True) + vectors_sq[None, :] - 2 * queries @ vectors.t()).clamp_(min=0)
+
+
+def _merge_topk(dist, idx, new_dist, new_idx, k):
+    dist = torch.cat([dist, new_dist], dim=1)
+    idx = torch.cat([idx, new_idx], dim=1)
+    dist, pos = dist.topk(min(k, dist.shape[1]), dim=1, largest=False)
+    return dist, idx.gather(1, pos)
+
+
+def kmeans(vectors, n_clusters, iterations=10, block_size=4096, generator=None):
+    centroids = vectors[torch.randperm(len(vectors), generator=generator)[:n_clusters]].clone()
+    for _ in range(iterations):
+        assign = nearest_centroids(vectors, centroids, 1, block_size)[:, 0]
+        sums = torch.zeros_like(centroids).index_add_(0, assign, vectors)
+        counts = torch.bincount(assign, minlength=n_clusters).to(vectors.dtype)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centroids
+
+
+def nearest_centroids(vectors, centroids, n_probe, block_size=4096):
+    centroids_sq = (centroids ** 2).sum(dim=1)
+    return torch.cat([_sq_dist(vectors[s:s + block_size], centroids, centroids_sq).topk(n_probe, dim=1, largest=False).indices
+                      for s in range(0, len(vectors), block_size)])
+
+
+class RepresentationIndex:
+    def __init__(self, vectors, labels=None, n_lists=0, n_probe=8, block_size=4096, kmeans_sample=256, seed=0):
+        """
+        Args:
+            vectors (Tensor): r(x) of the indexed rows, shape (n, hidden_size)
+            labels (Tensor): aux bitmasks of the rows, shape (n, aux_size), for knn_accuracy
+            n_lists (int): Number of IVF lists, 0 for exact search
+            n_probe (int): Lists scanned per query with IVF
+            kmeans_sample (int): k-means is trained on at most kmeans_sample * n_lists rows
+        """
+        self.vectors = vectors.float()
+        self.vectors_sq = (self.vectors ** 2).sum(dim=1)
+        self.labels = labels
+        self.block_size = block_size
+        self.n_lists = n_lists
+        self.n_probe = min(n_probe, n_lists) if n_lists > 0 else 0
+
+        if n_lists > 0:
+            generator = torch.Generator().manual_seed(seed)
+            sample = self.vectors[torch.randperm(len(self.vectors), generator=generator)[:kmeans_sample * n_lists].to(self.vectors.device)]
+            self.centroids = kmeans(sample, n_lists, block_size=block_size, generator=generator)
+            assign = nearest_centroids(self.vectors, self.centroids, 1, block_size)[:, 0]
+            # rows sorted by list, list c owns perm[offsets[c]:offsets[c + 1]]
+            self.perm = assign.argsort()
+            counts = torch.bincount(assign, minlength=n_lists)
+            self.offsets = torch.cat([counts.new_zeros(1), counts.cumsum(0)]).tolist()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k):
+        """
+        Returns:
+            (squared distances, row indices) of the k nearest rows, each of shape (len(queries), k)
+        """
+        queries = queries.float()
+        if self.n_lists == 0:
+            dist, idx = [], []
+            for s in range(0, len(queries), self.block_size):
+                d = _sq_dist(queries[s:s + self.block_size], self.vectors, self.vectors_sq)
+                d, i = d.topk(min(k, len(self)), dim=1, largest=False)
+                dist.append(d)
+                idx.append(i)
+            return torch.cat(dist), torch.cat(idx)
+
+        dist = queries.new_full((len(queries), k), float("inf"))
+        idx = torch.full((len(queries), k), -1, dtype=torch.long, device=queries.device)
+        probes = nearest_centroids(queries, self.centroids, self.n_probe, self.block_size)
+        for c in range(self.n_lists):
+            rows = self.perm[self.offsets[c]:self.offsets[c + 1]]
+            q = (probes == c).any(dim=1).nonzero(as_tuple=True)[0]
+            if len(rows) == 0 or len(q) == 0:
+                continue
+            for s in range(0, len(q), self.block_size):
+                qb = q[s:s + self.block_size]
+                d = _sq_dist(queries[qb], self.vectors[rows], self.vectors_sq[rows])
+                d, i = d.topk(min(k, len(rows)), dim=1, largest=False)
+                dist[qb], idx[qb] = _merge_topk(dist[qb], idx[qb], d, rows[i], k)
+        return dist, idx
+
+    def knn_predict(self, queries, k=10, exclude=None):
+        """
+        Majority vote of the labels of the k nearest rows, for each binary private variable.
+        exclude: row index of each query in this index (queries taken from the indexed rows), skipped.
+        """
+        dist, idx = self.search(queries, k + 1 if exclude is not None else k)
+        if exclude is not None:
+            idx = self._drop_self(dist, idx, exclude, k)[1]
+        labels = self.labels.float()[idx.clamp(min=0)]
+        valid = (idx >= 0).unsqueeze(2).float()
+        return ((labels * valid).sum(dim=1) / valid.sum(dim=1).clamp(min=1) >= 0.5).long()
+
+    def knn_accuracy(self, queries, query_labels, k=10):
+        """
+        kNN attacker: {attribute: (accuracy, f1)} of predicting the queries' private variables
+        """
+        return attack_metrics(self.knn_predict(queries, k), query_labels)
+
+    @staticmethod
+    def _drop_self(dist, idx, exclude, k):
+        keep = idx != exclude[:, None]
+        # keep the first k neighbours that are not the query itself
+        order = (~keep).float().argsort(dim=1, stable=True)[:, :k]
+        return dist.gather(1, order), idx.gather(1, order)
+
+    def membership_scores(self, queries, k=1, exclude=None):
+        """
+        Distance-based membership score: minus the mean distance to the k nearest indexed rows
+        (higher = more likely a training member).
+        """
+        dist, idx = self.search(queries, k + 1 if exclude is not None else k)
+        if exclude is not None:
+            dist = self._drop_self(dist, idx, exclude, k)[0]
+        return -dist.clamp(min=0).sqrt().mean(dim=1)
+
+
+def auc(member_scores, nonmember_scores):
+    """
+    Area under the ROC curve of separating members from non-members by score (Mann-Whitney U).
+    Tied scores get the mean of their ranks, so a tie counts as half a win (all-equal scores give 0.5).
+    """
+    scores = torch.cat([member_scores, nonmember_scores]).double()
+    _, groups, counts = scores.unique(return_inverse=True, return_counts=True)
+    # the tied scores of group g hold ranks ends[g] - counts[g] + 1 .. ends[g]
+    ends = counts.cumsum(0).to(scores.dtype)
+    ranks = (ends - (counts.to(scores.dtype) - 1) / 2)[groups]
+    n_pos, n_neg = len(member_scores), len(nonmember_scores)
+    return ((ranks[:n_pos].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)).item()
+
+
+def membership_audit(index, train_hidden, test_hidden, k=1, n_members=None):
+    """
+    Membership inference AUC of the distance score: training rows (each excluded from its own
+    neighbours) against test rows, both queried against `index`, built over train_hidden.
+    """
+    n_members = len(test_hidden) if n_members is None else n_members
+    members = torch.randperm(len(train_hidden), generator=torch.Generator().manual_seed(0))[:n_members].to(train_hidden.device)
+    member_scores = index.membership_scores(train_hidden[members], k=k, exclude=members)
+    nonmember_scores = index.membership_scores(test_hidden, k=k)
+    return auc(member_scores, nonmember_scores)
+
+
+if __name__ == "__main__":
+    # auc against the pairwise count P(member > non-member) + P(tie) / 2
+    generator = torch.Generator().manual_seed(0)
+    for members, nonmembers in [(torch.zeros(100), torch.zeros(100)), (torch.zeros(30), torch.zeros(70)),
+                                (torch.randint(3, (200,), generator=generator).float(), torch.randint(3, (150,), generator=generator).float()),
+                                (torch.randn(50, generator=generator), torch.randn(80, generator=generator))]:
+        expected = ((members[:, None] > nonmembers[None, :]).double() + 0.5 * (members[:, None] == nonmembers[None, :]).double()).mean().item()
+        assert abs(auc(members, nonmembers) - expected) < 1e-12, (auc(members, nonmembers), expected)
+    assert auc(torch.zeros(100), torch.zeros(100)) == 0.5
+    print("[ok] auc with tied scores")
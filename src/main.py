@@ -1,22 +1,39 @@
 from .tp_data_reader import get_dataset
+from .tokenizer import TOKENIZERS
 from .vocabulary import Vocabulary
 from .example import Example
 from .models.attacker import *
+from .models.declustering import DeclusteringLoss
+from .models.encoders import ENCODERS
 from .dataset import PrDataset, AttackDataset
+from .attack_zoo import run_attack_zoo, print_attack_zoo, attack_metrics, AUX_NAMES
+from .repr_file import RepresentationWriter, RepresentationFile, model_hash, DTYPES
+from .knn_index import RepresentationIndex, membership_audit
+from . import dp_sampling
+from .dp_accounting import solve_noise_multiplier
+from .noise import NoiseInjector, DISTRIBUTIONS
+from .execution import autocast, compile_methods, PRECISIONS
+from .background import Validator, CheckpointWriter, clone_state, rng_state, set_rng_state
+from .results_store import ResultsStore
+from .optional import require, progress
+from .pretrained import init_embedding
+from .probe import LeakageProbe
+from .corpus_cache import CorpusCache
+from .dedup import deduplicate, print_dedup_report
+from .bootstrap import confidence_interval, paired_bootstrap, print_intervals, print_paired
+from .shards import ShardedDataset, write_shards, shard_key, stale_keys
 
 from collections import defaultdict
+import argparse
+import json
 import torch.nn as nn
 import torch
 from torch import optim
 from torch.utils.data import DataLoader
 import sys
-from tqdm import tqdm
+import os
+import time
 import numpy as np
-from sklearn.metrics import f1_score
-
-import pytorch_influence_functions as pif
-from pyvacy import optim, analysis, sampling
-from torch.utils.data import DataLoader, TensorDataset
 
 def extract_vocabulary(dataset, add_symbols=None):
     freqs = defaultdict(int)
@@ -57,6 +74,9 @@ class PrModel:
             alphabet_size=vocabulary.size_chars(), vocab_size=vocabulary.size_words(), 
             output_size=classifier_output_size, args=args
             ).to(self.device)
+        if self.args.pretrained_vectors is not None:
+            init_embedding(self.main_classifier.word_embedding, vocabulary.words, self.args.pretrained_vectors,
+                           freeze=self.args.freeze_embedding)
         self.adversary_classifier = AdversaryClassifier(
             self.main_classifier.hidden_size, 
             output_size=adversary_output_size, args=args
@@ -70,52 +90,189 @@ class PrModel:
 
         if self.args.atraining:
             self.a_optimizer = optim.Adam(self.discriminator.parameters(), lr=args.learning_rate)
+
+        if self.args.compile:
+            compile_methods(self.main_classifier, 'get_lstm_embed', 'classify')
+            compile_methods(self.adversary_classifier, 'forward')
+
+        # results store, set by main() with --results-db
+        self.results = None
+        self.epsilon = None
+        # extra attackers trained by the attack zoo, evaluated again by evaluate_test
+        self.attackers = []
+
+        # background checkpoint serialization
+        self.writer = None
+        if self.args.checkpoint_dir is not None:
+            os.makedirs(self.args.checkpoint_dir, exist_ok=True)
+            self.writer = CheckpointWriter()
+
+        # loss/gradient noise defenses
+        self.noise = NoiseInjector(
+            self.main_classifier.parameters(), self.device,
+            distribution=args.noise_distribution, scale=args.noise_scale, seed=args.noise_seed
+            )
+        if self.args.atraining:
+            self.discriminator_noise = NoiseInjector(
+                self.discriminator.parameters(), self.device,
+                distribution=args.noise_distribution, scale=args.noise_scale, seed=args.noise_seed + 1
+                )
+
+        # declustering defense
+        if self.args.ptraining:
+            self.declustering = DeclusteringLoss(
+                self.main_classifier.hidden_size, aux_size=adversary_output_size,
+                bank_size=args.memory_bank_size
+                ).to(self.device)
     
+    def autocast(self):
+        return autocast(self.device, self.args.precision)
+
     def get_input(self, example: Example, adversarial=False):
         return self.vocabulary.code_sentence_cw(example.get_sentence(), adversarial=adversarial)
     
     def discriminator_train(self, hidden_state, target):
-        # change device
-        hidden_state, fake_labels = _to_device(hidden_state, target, device=self.device)
-
-        fake_labels = ~target
-        fake_loss = self.discriminator.get_loss(hidden_state, fake_labels)
-        # fake_loss.backward()
-
-        # self.a_optimizer.step()
-        # self.a_optimizer.zero_grad()
-
-        return fake_loss#.item()
-
-    def evaluate_main(self, dataset):
-        self.main_classifier.eval()
+        """
+        Adversarial defense loss on an already computed r(x).
+        The gradient reversal layer trains the discriminator to predict the private
+        variables while pushing the encoder to hide them, in the same backward pass.
+        """
+        hidden_state, target = _to_device(hidden_state, target, device=self.device)
+        self.discriminator.train()
+        hidden_state = grad_reverse(hidden_state, self.args.adversary_weight)
+        return self.discriminator.get_loss(hidden_state, target)
+
+    def privacy_train(self, hidden_state, target):
+        """
+        Declustering defense loss on an already computed r(x)
+        """
+        hidden_state, target = _to_device(hidden_state, target, device=self.device)
+        return self.args.declustering_weight * self.declustering(hidden_state.float(), target)
+
+    def checkpoint_path(self, name):
+        return os.path.join(self.args.checkpoint_dir, f"{name}.pt") if self.writer is not None else None
+
+    def save_checkpoint(self, name, epoch, state, optimizer, defenses=False):
+        """
+        Queues the last-epoch checkpoint (model snapshot, optimizer and RNG states, and with `defenses`
+        the state of the defenses trained along with the model) to the background writer
+        """
+        if self.writer is None:
+            return
+        checkpoint = {"epoch": epoch, "model": state, "optimizer": clone_state(optimizer.state_dict()), "rng": rng_state()}
+        if defenses:
+            checkpoint["defenses"] = self.defense_state()
+        self.writer.save(checkpoint, self.checkpoint_path(f"{name}_last"))
+
+    def defense_state(self):
+        state = {"noise": self.noise.generator.get_state()}
+        if self.args.atraining:
+            state["discriminator_noise"] = self.discriminator_noise.generator.get_state()
+            state["discriminator"] = clone_state(self.discriminator.state_dict())
+            state["a_optimizer"] = clone_state(self.a_optimizer.state_dict())
+        if self.args.ptraining:
+            # includes the memory bank
+            state["declustering"] = clone_state(self.declustering.state_dict())
+        return state
+
+    def training_shards(self):
+        """
+        Directory of the training shards of --shard-dir, (re)written from the corpus cache when they are
+        missing or stale (another dataset, tokenizer, seq_len, a vocabulary extended by src.incremental, ...),
+        which would otherwise map to wrong word ids
+        """
+        directory = os.path.join(self.args.shard_dir, "train")
+        cache = CorpusCache(self.args.corpus_dir)
+        key = shard_key(cache, "train", self.vocabulary, self.args.seq_len, self.adversary_classifier.output_size)
+        stale = stale_keys(directory, key)
+        if stale is None or stale:
+            print("writing shards..." if stale is None else f"rewriting stale shards ({', '.join(stale)})...")
+            # streamed from the cache, the split is never held in memory
+            write_shards(cache.iterate("train"), self.vocabulary, self.args.seq_len, directory,
+                         aux_size=key["aux_size"], dataset=key["dataset"], tokenizer=key["tokenizer"])
+        return directory
+
+    def load_defense_state(self, state):
+        self.noise.generator.set_state(state["noise"].cpu())
+        if self.args.atraining and "discriminator_noise" in state:
+            self.discriminator_noise.generator.set_state(state["discriminator_noise"].cpu())
+        if self.args.atraining and "discriminator" in state:
+            self.discriminator.load_state_dict(state["discriminator"])
+            self.a_optimizer.load_state_dict(state["a_optimizer"])
+        if self.args.ptraining and "declustering" in state:
+            self.declustering.load_state_dict(state["declustering"])
+
+    def record(self, phase, epoch, **metrics):
+        if self.results is not None and epoch != "final":
+            self.results.log_epoch(phase, epoch, **metrics)
+
+    def load_checkpoint(self, name, model, optimizer):
+        """
+        With --resume, restores the last-epoch checkpoint of `name` into model and optimizer.
+        Returns the epoch to resume from (0 if there is nothing to resume).
+        """
+        path = self.checkpoint_path(f"{name}_last")
+        if not self.args.resume or path is None or not os.path.exists(path):
+            return 0
+        checkpoint = torch.load(path, map_location=self.device)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        if "defenses" in checkpoint:
+            self.load_defense_state(checkpoint["defenses"])
+        # continue the data order and sampling of the interrupted run
+        if "rng" in checkpoint:
+            set_rng_state(checkpoint["rng"])
+        print(f"[resumed {name} from epoch={checkpoint['epoch']}]")
+        return checkpoint["epoch"]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def evaluate_main(self, dataset, model=None, return_correct=False):
+        """
+        With return_correct, also returns the per-example correctness (bool tensor of shape (n,))
+        """
+        model = self.main_classifier if model is None else model
+        model.eval()
         device = self.device
         
         loss = 0
         acc = 0
         tot = 0#len(dataset)
-        with torch.no_grad():
+        correct = []
+        with torch.no_grad(), self.autocast():
             for i, (input_vec, aux, target) in enumerate(dataset):
                 input_vec = input_vec.to(device)
                 target = target.to(device)
-                l, predicts = self.main_classifier.get_loss_prediction(input_vec, target)
+                l, predicts = model.get_loss_prediction(input_vec, target)
                 loss += l.item()
-                for p, t in zip(predicts, target):
-                    tot += 1
-                    if p.item() == t.item():
-                        acc += 1
+                hits = predicts.view(-1) == target.view(-1)
+                correct.append(hits)
+                tot += len(hits)
+                acc += hits.sum().item()
 #                 print(acc, tot)
+        if return_correct:
+            return (loss / tot), round(acc / tot  * 100, 3), torch.cat(correct)
         return (loss / tot), round(acc / tot  * 100, 3)
 
 
+    def evaluate_main_probe(self, dataset, probe, model=None):
+        """
+        evaluate_main followed by the online leakage probe on the same weights
+        """
+        l, acc = self.evaluate_main(dataset, model)
+        start = time.perf_counter()
+        leakage = probe(self.main_classifier if model is None else model)
+        return l, acc, leakage, time.perf_counter() - start
+
     def train_main(self, train, dev):
         
-        l2_norm_clip = 1.0
-        noise_multiplier = 1.1
+        l2_norm_clip = self.args.l2_norm_clip
+        noise_multiplier = self.args.noise_multiplier
         minibatch_size = self.args.batch_size
         microbatch_size = 1
-        iterations = self.args.iterations
-        delta = 1e-5
+        delta = self.args.delta
         
         
         lr = self.args.learning_rate
@@ -126,47 +283,90 @@ class PrModel:
 
         train_dataset = PrDataset(train, self.vocabulary, self.args.seq_len, aux_size=output_size)
         val_dataset = PrDataset(dev, self.vocabulary, self.args.seq_len, aux_size=output_size)
+        # not shuffled: validation may run on a background thread and must not draw from the global RNG
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=0)
         
         if self.args.is_add_gradient_noise:
-            optimizer = optim.DPAdam(
+            # one epoch = n / minibatch_size subsampled steps over the encoded split
+            steps_per_epoch = max(len(train_dataset) // minibatch_size, 1)
+            if self.args.target_epsilon is not None:
+                noise_multiplier = solve_noise_multiplier(
+                    self.args.target_epsilon, min(minibatch_size / len(train_dataset), 1.),
+                    steps_per_epoch * self.args.iterations, delta, scheme=self.args.dp_sampling)
+                print(f"[dp] noise multiplier for epsilon={self.args.target_epsilon}: {noise_multiplier:.3f}")
+            dp_optim = require("pyvacy.optim", "--is-add-gradient-noise")
+            optimizer = dp_optim.DPAdam(
                 l2_norm_clip=l2_norm_clip,
                 noise_multiplier=noise_multiplier,
                 minibatch_size=minibatch_size,
                 microbatch_size=microbatch_size,
                 params=self.main_classifier.parameters(),
                 lr=lr)
-            minibatch_loader, microbatch_loader = sampling.get_data_loaders(minibatch_size, microbatch_size, iterations)
-            print('Achieves ({}, {})-DP'.format(analysis.epsilon(len(train_dataset), minibatch_size, noise_multiplier,
-                    iterations, delta,), delta, ))
-            train_loader = minibatch_loader(train_dataset)
-            val_loader = minibatch_loader(val_dataset)
+            train_loader = dp_sampling.SubsampledLoader(
+                train_dataset.tensors(), minibatch_size, steps_per_epoch, scheme=self.args.dp_sampling)
+            self.epsilon = dp_sampling.epsilon(len(train_dataset), minibatch_size, noise_multiplier,
+                    steps_per_epoch * self.args.iterations, delta, scheme=self.args.dp_sampling)
+            print('Achieves ({}, {})-DP'.format(self.epsilon, delta, ))
+        elif self.args.shard_dir is not None:
+            # stream the encoded training split from disk, workers read disjoint shards
+            optimizer = optim.Adam([p for p in self.main_classifier.parameters() if p.requires_grad], lr=lr)
+            train_dataset = ShardedDataset(self.training_shards(), buffer_size=self.args.shuffle_buffer)
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, num_workers=self.args.loader_workers)
         else:
-            optimizer = optim.Adam(self.main_classifier.parameters(), lr=lr)
+            optimizer = optim.Adam([p for p in self.main_classifier.parameters() if p.requires_grad], lr=lr)
             train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=0)
-            val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=True, num_workers=0)
             
         
 
-        # epoch 0
-        l, acc = self.evaluate_main(val_loader)
-        print(f"[epoch=0] loss: {l}, acc: {acc}%")
-
-        best_val_loss = 1000
-        best_model = None
-        for i in range(self.args.iterations):
+        def log(epoch, result):
+            l, acc = result[:2]
+            print(f"[val epoch={epoch}] loss: {l}, acc: {acc}%")
+            self.record("main_val", epoch, loss=l, acc=acc)
+            if len(result) > 2:
+                (gender_acc, age_acc), probe_time = result[2:]
+                print(f"[probe epoch={epoch}] gender acc: {gender_acc}%, age acc: {age_acc}%, time: {probe_time:.2f}s")
+                self.record("main_probe", epoch, gender_acc=gender_acc, age_acc=age_acc, time=probe_time)
+
+        evaluate = lambda model: self.evaluate_main(val_loader, model)
+        criterion = None
+        if self.args.leakage_probe or self.args.selection == "utility-leakage":
+            probe = LeakageProbe(train, dev, self.vocabulary, self.args.seq_len, output_size, device, size=self.args.probe_size)
+            evaluate = lambda model: self.evaluate_main_probe(val_loader, probe, model)
+        if self.args.selection == "utility-leakage":
+            # maximize task accuracy minus weighted mean probe accuracy
+            criterion = lambda result: self.args.leakage_weight * sum(result[2]) / len(result[2]) - result[1]
+
+        validator = Validator(
+            self.main_classifier, evaluate, log,
+            asynchronous=self.args.async_validation, writer=self.writer, best_path=self.checkpoint_path("main_best"),
+            criterion=criterion)
+        # the untrained weights are not a candidate, a resumed run keeps its best epoch so far
+        start_epoch = self.load_checkpoint("main", self.main_classifier, optimizer)
+        if start_epoch > 0:
+            validator.restore(self.checkpoint_path("main_best"), map_location=self.device)
+
+        for i in range(start_epoch, self.args.iterations):
             self.main_classifier.train()
+            if isinstance(train_dataset, ShardedDataset):
+                train_dataset.set_epoch(i)
+            start = time.perf_counter()
             train_loss = 0
             train_acc = 0
             train_tot = 0
-            for _i, (input_vec, aux, target) in enumerate(tqdm(train_loader)):
+            for _i, (input_vec, aux, target) in enumerate(progress(train_loader)):
                 optimizer.zero_grad()
+                if self.args.atraining:
+                    self.a_optimizer.zero_grad()
                 
                 if self.args.is_add_gradient_noise:
-                    for X_microbatch, y_microbatch  in microbatch_loader(TensorDataset(input_vec, target)):
+                    # batch sizes vary under Poisson sampling, DPAdam normalizes by the expected size
+                    input_vec, target = _to_device(input_vec, target, device=device)
+                    for mb in range(0, len(input_vec), microbatch_size):
                         optimizer.zero_microbatch_grad()
-                        X_microbatch = X_microbatch.to(device)
-                        y_microbatch = y_microbatch.to(device)
-                        loss, predicts = self.main_classifier.get_loss_prediction(X_microbatch, y_microbatch)
+                        X_microbatch = input_vec[mb:mb + microbatch_size]
+                        y_microbatch = target[mb:mb + microbatch_size]
+                        with self.autocast():
+                            loss, predicts = self.main_classifier.get_loss_prediction(X_microbatch, y_microbatch)
                         loss.backward()
                         optimizer.microbatch_step()
                         train_loss += loss.item()
@@ -177,65 +377,73 @@ class PrModel:
                 else:
                     input_vec = input_vec.to(device)
                     target = target.to(device)
-                    loss, predicts = self.main_classifier.get_loss_prediction(input_vec, target)
-                    train_loss += loss.item()
-                    if self.args.is_add_loss_noise:  
-                        loss = loss + self.add_loss_noise() #add noise before backward
-                    if self.args.atraining:
-                        loss += self.discriminator_train(self.main_classifier.get_lstm_embed(input_vec), aux)
+                    with self.autocast():
+                        if self.args.atraining or self.args.ptraining:
+                            # single BiLSTM pass: r(x) feeds the main head and the defenses
+                            loss, predicts, hidden_state = self.main_classifier.get_loss_prediction_embed(input_vec, target)
+                        else:
+                            loss, predicts = self.main_classifier.get_loss_prediction(input_vec, target)
+                        train_loss += loss.item()
+                        if self.args.is_add_loss_noise:  
+                            loss = loss + self.add_loss_noise() #add noise before backward
+                        if self.args.atraining:
+                            loss = loss + self.discriminator_train(hidden_state, aux)
+                        if self.args.ptraining:
+                            loss = loss + self.privacy_train(hidden_state, aux)
                     loss.backward()  
+                    if self.args.is_add_raw_gradient_noise:
+                        self.add_gradient_noise()
                     for p, t in zip(predicts, target):
                         train_tot += 1
                         if predicts[0].item() == target[0].item():
                             train_acc += 1
                     optimizer.step()
-            
-            # if self.args.ptraining:
-            #     self.privacy_train(example, train)
-
-            # if self.args.atraining:
-            #     discriminator_loss += self.discriminator_train(example)
+                    if self.args.atraining:
+                        self.a_optimizer.step()
 
             # if self.args.generator:
             #     generator_loss += self.generator_train(example)
 
             train_acc = round(train_acc / train_tot  * 100, 3)
-            print(f"[train epoch={i+1}] loss: {train_loss}, acc: {train_acc}%")
-            l, acc = self.evaluate_main(val_loader)
-            print(f"[val epoch={i+1}] loss: {l}, acc: {acc}%")
-            
-            if l < best_val_loss:
-                best_val_loss = l
-                best_model = self.main_classifier
-                print('[best_model updated]')
-        self.main_classifier = best_model
-        l, acc = self.evaluate_main(val_loader)
-        print(f"[val epoch=final] loss: {l}, acc: {acc}%")
+            print(f"[train epoch={i+1}] loss: {train_loss}, acc: {train_acc}%, time: {time.perf_counter() - start:.2f}s")
+            self.record("main_train", i + 1, loss=train_loss, acc=train_acc, time=time.perf_counter() - start)
+
+            state = clone_state(self.main_classifier.state_dict())
+            validator.submit(i + 1, state, self.main_classifier)
+            self.save_checkpoint("main", i + 1, state, optimizer, defenses=True)
+
+        validator.close()
+        result = validator.load_best(self.main_classifier)
+        log("final", result)
+        return result[1]
 
             
  
-    def evaluate_adversarial(self, dataset):
-        self.adversary_classifier.eval()
+    def evaluate_adversarial(self, dataset, adversary=None, return_correct=False):
+        """
+        With return_correct, also returns the per-example correctness (bool tensor of shape (n, aux_size))
+        """
+        adversary = self.adversary_classifier if adversary is None else adversary
+        adversary.eval()
         self.main_classifier.eval()
         device = self.device
         loss = 0
-        gender_acc = 0
-        age_acc = 0
         tot = 0#len(dataset)
-        with torch.no_grad():
+        correct = []
+        with torch.no_grad(), self.autocast():
             for i, (input_vec, target) in enumerate(dataset):
                 input_vec = input_vec.to(device)
                 target = target.to(device)
                 hidden_state = self.main_classifier.get_lstm_embed(input_vec)
-                l, predicts = self.adversary_classifier.get_loss_prediction(hidden_state, target)
+                l, predicts = adversary.get_loss_prediction(hidden_state, target)
                 loss += l.item()
-                for p, t in zip(predicts, target):
-                    tot += 1
-                    if p[0].item() == t[0].item():
-                        gender_acc += 1
-                    if p[1].item() == t[1].item():
-                        age_acc += 1
-        return loss / tot, round(gender_acc / tot * 100, 3) , round(age_acc / tot * 100, 3) 
+                correct.append(predicts == target.cpu().float())
+                tot += len(target)
+        correct = torch.cat(correct)
+        gender_acc, age_acc = (correct[:, :2].sum(dim=0) / tot * 100).tolist()
+        if return_correct:
+            return loss / tot, round(gender_acc, 3), round(age_acc, 3), correct
+        return loss / tot, round(gender_acc, 3), round(age_acc, 3)
 
     def train_adversarial(self, train, dev):
         lr = self.args.learning_rate
@@ -244,34 +452,50 @@ class PrModel:
         output_size =  self.adversary_classifier.output_size
         seq_len = self.args.seq_len
         
-        train_dataset = AttackDataset(train, self.vocabulary, seq_len, output_size)
+        if self.args.shard_dir is not None:
+            train_dataset = ShardedDataset(self.training_shards(), buffer_size=self.args.shuffle_buffer, return_label=False)
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, num_workers=self.args.loader_workers)
+        else:
+            train_dataset = AttackDataset(train, self.vocabulary, seq_len, output_size)
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=0)
         val_dataset = AttackDataset(dev, self.vocabulary, seq_len, output_size)
-        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=0)
-        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=True, num_workers=0)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=0)
         
         optimizer = optim.Adam(self.adversary_classifier.parameters(), lr=lr)
 
-        # epoch 0
-        l, gender_acc, age_acc = self.evaluate_adversarial(val_loader)
-        print(f"[epoch=0] loss: {l}, gender acc: {gender_acc}%, age acc: {age_acc}%")
+        def log(epoch, result):
+            l, gender_acc, age_acc = result
+            print(f"[val epoch={epoch}] loss: {l}, gender acc: {gender_acc}%, age acc: {age_acc}%")
+            self.record("adversary_val", epoch, loss=l, gender_acc=gender_acc, age_acc=age_acc)
 
-        best_val_loss = 1000
-        best_model = None
+        # the main classifier is frozen from here on, so the background worker can share it
         self.main_classifier.eval()
-        for i in range(self.args.iterations):
+        validator = Validator(
+            self.adversary_classifier, lambda model: self.evaluate_adversarial(val_loader, model), log,
+            asynchronous=self.args.async_validation, writer=self.writer, best_path=self.checkpoint_path("adversary_best"))
+        # the untrained weights are not a candidate, a resumed run keeps its best epoch so far
+        start_epoch = self.load_checkpoint("adversary", self.adversary_classifier, optimizer)
+        if start_epoch > 0:
+            validator.restore(self.checkpoint_path("adversary_best"), map_location=self.device)
+
+        for i in range(start_epoch, self.args.iterations):
             self.adversary_classifier.train()
+            if isinstance(train_dataset, ShardedDataset):
+                train_dataset.set_epoch(i)
+            start = time.perf_counter()
             
             train_loss = 0
             train_gender_acc = 0
             train_age_acc = 0
             train_tot = 0
             
-            for _i, (input_vec, target) in enumerate(tqdm(train_loader)):
+            for _i, (input_vec, target) in enumerate(progress(train_loader)):
                 input_vec = input_vec.to(device)
                 target = target.to(device)
-                hidden_state = self.main_classifier.get_lstm_embed(input_vec)
-                hidden_state = hidden_state.detach()
-                loss, predicts = self.adversary_classifier.get_loss_prediction(hidden_state, target)
+                with self.autocast():
+                    hidden_state = self.main_classifier.get_lstm_embed(input_vec)
+                    hidden_state = hidden_state.detach()
+                    loss, predicts = self.adversary_classifier.get_loss_prediction(hidden_state, target)
                 loss.backward()
                 optimizer.step()
                 optimizer.zero_grad()
@@ -293,18 +517,206 @@ class PrModel:
                 #     generator_loss += self.generator_train(example)
             train_gender_acc = round(train_gender_acc / train_tot  * 100, 3)
             train_age_acc = round(train_age_acc / train_tot  * 100, 3)
-            print(f"[train epoch={i+1}] loss: {train_loss}, gender acc: {train_gender_acc}%, age acc: {train_age_acc}%")
-            l, gender_acc, age_acc = self.evaluate_adversarial(val_loader)
-            print(f"[val epoch={i+1}] loss: {l}, gender acc: {gender_acc}%, age acc: {age_acc}%")
-            
-            if l < best_val_loss:
-                best_val_loss = l
-                best_model = self.adversary_classifier
-                print('[best_model updated]')
-                
-        self.adversary_classifier = best_model
-        l, gender_acc, age_acc = self.evaluate_adversarial(val_loader)
-        print(f"[val epoch=final] loss: {l}, gender acc: {gender_acc}%, age acc: {age_acc}%")
+            print(f"[train epoch={i+1}] loss: {train_loss}, gender acc: {train_gender_acc}%, age acc: {train_age_acc}%, time: {time.perf_counter() - start:.2f}s")
+            self.record("adversary_train", i + 1, loss=train_loss, gender_acc=train_gender_acc, age_acc=train_age_acc,
+                        time=time.perf_counter() - start)
+
+            state = clone_state(self.adversary_classifier.state_dict())
+            validator.submit(i + 1, state, self.adversary_classifier)
+            self.save_checkpoint("adversary", i + 1, state, optimizer)
+
+        validator.close()
+        result = validator.load_best(self.adversary_classifier)
+        log("final", result)
+        return result[1], result[2]
+
+    def evaluate_bootstrap(self, examples, split="dev"):
+        """
+        Bootstrap confidence intervals of the task and adversary accuracies on `examples`.
+        Returns {split: {"names", "correct"}}, correct being the (3, n) per-example correctness.
+        """
+        task_correct, target, predicts = self.evaluate_single_pass(examples)
+        aux_correct = predicts["adversary"] == target
+        names = ["task acc", "gender acc", "age acc"]
+        correct = torch.stack([task_correct, aux_correct[:, 0], aux_correct[:, 1]])
+
+        start = time.perf_counter()
+        intervals = confidence_interval(correct, self.args.bootstrap)
+        print(f"[bootstrap {split}] {self.args.bootstrap} resamples, time: {time.perf_counter() - start:.2f}s")
+        print_intervals(names, intervals)
+        if self.args.compare_to is not None:
+            other = torch.load(self.args.compare_to)[split]
+            if other["correct"].shape != correct.shape:
+                raise ValueError(f"{self.args.compare_to} was evaluated on different {split} examples")
+            print(f"[bootstrap {split}] paired difference with {self.args.compare_to}")
+            print_paired(names, paired_bootstrap(correct, other["correct"], self.args.bootstrap))
+        return {split: {"names": names, "correct": correct}}
+
+    def evaluate_single_pass(self, examples, attackers=()):
+        """
+        Encodes the examples once: each batch of r(x) feeds the main head, the adversary and the extra attackers.
+
+        Args:
+            attackers (list): Callables r(x) -> {attacker name: binary predictions (batch, aux_size)}
+        Returns:
+            (Tensor, Tensor, dict): task correctness (n,), aux bitmasks (n, aux_size),
+            {"adversary" or attacker name: binary predictions (n, aux_size)}
+        """
+        self.main_classifier.eval()
+        self.adversary_classifier.eval()
+        dataset = PrDataset(examples, self.vocabulary, self.args.seq_len, aux_size=self.adversary_classifier.output_size)
+        loader = DataLoader(dataset, batch_size=self.args.batch_size, shuffle=False, num_workers=0)
+        task_correct, targets, predicts = [], [], defaultdict(list)
+        with torch.no_grad(), self.autocast():
+            for input_vec, aux, target in loader:
+                hidden_state = self.main_classifier.get_lstm_embed(input_vec.to(self.device))
+                output = self.main_classifier.classify(hidden_state)
+                task_correct.append((output.argmax(dim=1) == target.to(self.device).view(-1)).cpu())
+                targets.append(aux)
+                predicts["adversary"].append((self.adversary_classifier(hidden_state) >= 0.5).long().cpu())
+                hidden_state = hidden_state.float()
+                for attacker in attackers:
+                    for name, p in attacker(hidden_state).items():
+                        predicts[name].append(p.long().cpu())
+        return torch.cat(task_correct), torch.cat(targets), {name: torch.cat(p) for name, p in predicts.items()}
+
+    def evaluate_test(self, test):
+        """
+        Final evaluation of the main task, the adversary and the attack zoo attackers on the test split,
+        with a single encoder pass. Returns the combined report (also written to --test-report).
+        """
+        start = time.perf_counter()
+        task_correct, target, predicts = self.evaluate_single_pass(test, self.attackers)
+        elapsed = time.perf_counter() - start
+        task_acc = round(task_correct.float().mean().item() * 100, 3)
+        attacks = {name: attack_metrics(p, target) for name, p in predicts.items()}
+        print(f"[test] task acc: {task_acc}%, {len(task_correct)} examples, {len(predicts) + 1} heads, time: {elapsed:.2f}s")
+        print_attack_zoo(attacks)
+
+        report = {"split": "test", "examples": len(task_correct), "task_acc": task_acc, "attackers": attacks,
+                  "epsilon": self.epsilon}
+        if self.args.bootstrap > 0:
+            aux_correct = predicts["adversary"] == target
+            names = ["task acc", "gender acc", "age acc"]
+            intervals = confidence_interval(torch.stack([task_correct, aux_correct[:, 0], aux_correct[:, 1]]), self.args.bootstrap)
+            print(f"[bootstrap test] {self.args.bootstrap} resamples")
+            print_intervals(names, intervals)
+            report["intervals"] = dict(zip(names, intervals))
+        if self.args.test_report is not None:
+            with open(self.args.test_report, "w") as f:
+                json.dump(report, f, indent=1)
+        return report
+
+    def extract_representations(self, examples):
+        """
+        Encodes the examples once with the main classifier.
+        Returns r(x) of shape (n, hidden_size) and the aux bitmasks of shape (n, aux_size).
+        """
+        self.main_classifier.eval()
+        dataset = AttackDataset(examples, self.vocabulary, self.args.seq_len, self.adversary_classifier.output_size)
+        loader = DataLoader(dataset, batch_size=self.args.batch_size, shuffle=False, num_workers=0)
+        hidden_states, targets = [], []
+        with torch.no_grad(), self.autocast():
+            for input_vec, target in loader:
+                hidden_states.append(self.main_classifier.get_lstm_embed(input_vec.to(self.device)).float())
+                targets.append(target.to(self.device))
+        return torch.cat(hidden_states), torch.cat(targets)
+
+    def evaluate_attack_zoo(self, train, dev):
+        train_hidden, train_target = self.extract_representations(train)
+        val_hidden, val_target = self.extract_representations(dev)
+        results, self.attackers = run_attack_zoo(
+            train_hidden, train_target, val_hidden, val_target,
+            widths=self.args.zoo_widths, k=self.args.knn_k, epochs=self.args.zoo_epochs,
+            batch_size=self.args.batch_size, lr=self.args.learning_rate, return_attackers=True)
+        return results
+
+    def evaluate_knn_audit(self, train, dev, test):
+        """
+        kNN attacker accuracy on dev and distance-based membership inference (train vs. test),
+        over an index of the training representations
+        """
+        train_hidden, train_target = self.extract_representations(train)
+        val_hidden, val_target = self.extract_representations(dev)
+        test_hidden, _ = self.extract_representations(test)
+
+        start = time.perf_counter()
+        index = RepresentationIndex(train_hidden, train_target, n_lists=self.args.ivf_lists, n_probe=self.args.ivf_probe)
+        metrics = index.knn_accuracy(val_hidden, val_target, k=self.args.knn_k)
+        print_attack_zoo({f"knn-{self.args.knn_k} index": metrics})
+        membership_auc = membership_audit(index, train_hidden, test_hidden)
+        print(f"[knn audit] membership auc: {round(membership_auc * 100, 3)}%, time: {time.perf_counter() - start:.2f}s")
+        return metrics, membership_auc
+
+    def export_representations(self, examples, filename, split, dtype="int8"):
+        """
+        Encodes the examples batch by batch into a (quantized) representation file, see src.repr_file
+        """
+        self.main_classifier.eval()
+        output_size = self.adversary_classifier.output_size
+        dataset = AttackDataset(examples, self.vocabulary, self.args.seq_len, output_size)
+        loader = DataLoader(dataset, batch_size=self.args.batch_size, shuffle=False, num_workers=0)
+        writer = RepresentationWriter(
+            filename, self.main_classifier.hidden_size, output_size, dtype=dtype,
+            model_hash=model_hash(self.main_classifier), dataset=self.args.dataset, split=split,
+            encoder=self.args.encoder, aux_names=AUX_NAMES[:output_size])
+        with torch.no_grad(), self.autocast():
+            for input_vec, target in loader:
+                writer.write(self.main_classifier.get_lstm_embed(input_vec.to(self.device)), target)
+        writer.close()
+
+    def train_adversary_from_file(self, train_file, dev_file):
+        """
+        Trains a fresh AdversaryClassifier on an exported representation file (read zero-copy and
+        dequantized batch by batch) and returns its (gender_acc, age_acc) on the dev file
+        """
+        train, dev = RepresentationFile(train_file), RepresentationFile(dev_file)
+        adversary = AdversaryClassifier(train.dim, output_size=train.aux_size, args=self.args).to(self.device)
+        optimizer = optim.Adam(adversary.parameters(), lr=self.args.learning_rate)
+        generator = torch.Generator().manual_seed(0)
+        for i in range(self.args.iterations):
+            adversary.train()
+            for hidden_state, target in train.batches(self.args.batch_size, shuffle=True, generator=generator):
+                optimizer.zero_grad()
+                loss, _ = adversary.get_loss_prediction(hidden_state.to(self.device), target.to(self.device))
+                loss.backward()
+                optimizer.step()
+
+        adversary.eval()
+        correct, tot = 0, 0
+        with torch.no_grad():
+            for hidden_state, target in dev.batches(self.args.batch_size):
+                _, predicts = adversary.get_loss_prediction(hidden_state.to(self.device), target.to(self.device))
+                correct += (predicts == target.float()).sum(dim=0)
+                tot += len(target)
+        gender_acc, age_acc = (correct[:2] / tot * 100).tolist()
+        return round(gender_acc, 3), round(age_acc, 3)
+
+    def evaluate_quantization(self, train, dev):
+        """
+        Exports train and dev r(x) in every --repr-dtypes (and float32 as the reference) to --export-repr,
+        and compares the accuracy of attackers trained on each
+        """
+        results = {}
+        dtypes = list(self.args.repr_dtypes)
+        if self.args.quantization_study and "float32" not in dtypes:
+            dtypes.insert(0, "float32")
+        for dtype in dtypes:
+            files = {}
+            for split, examples in [("train", train), ("dev", dev)]:
+                files[split] = os.path.join(self.args.export_repr, f"{split}.{dtype}.repr")
+                self.export_representations(examples, files[split], split, dtype)
+            if not self.args.quantization_study:
+                continue
+            torch.manual_seed(0)
+            start = time.perf_counter()
+            gender_acc, age_acc = self.train_adversary_from_file(files["train"], files["dev"])
+            size = os.path.getsize(files["train"]) / 2 ** 20
+            results[dtype] = (gender_acc, age_acc)
+            reference = results.get("float32", results[dtype])
+            print(f"[quantization {dtype}] train file: {size:.1f}MB, gender acc: {gender_acc}% ({gender_acc - reference[0]:+.3f}), "
+                  f"age acc: {age_acc}% ({age_acc - reference[1]:+.3f}), time: {time.perf_counter() - start:.2f}s")
+        return results
 
     def evaluate_influence_sample(self, train, test):
         train_dataset = PrDataset(train, self.vocabulary, self.args.seq_len, return_aux=False)
@@ -312,6 +724,7 @@ class PrModel:
         train_dataloader = DataLoader(train_dataset, batch_size=self.args.batch_size)
         test_dataloader = DataLoader(test_dataset, batch_size=self.args.batch_size)
 
+        pif = require("pytorch_influence_functions", "--is-influence-sample")
         config = pif.get_default_config()
         self.main_classifier = self.main_classifier.cpu()
         
@@ -325,57 +738,135 @@ class PrModel:
         pif.calc_all_grad_then_test(config, self.adversary_classifier, train_dataloader, test_dataloader)
         
     def add_gradient_noise(self):
-        for p in self.main_classifier.parameters():
-            noise = np.random.laplace(loc=0, scale=1, size = p.grad.shape)
-            p.grad += torch.from_numpy(noise).to(self.device)
+        """
+        Noise on the gradients of the main classifier, and of the discriminator trained along with it
+        """
+        self.noise.add_gradient_noise()
+        if self.args.atraining:
+            self.discriminator_noise.add_gradient_noise()
         
     def add_loss_noise(self):
-        noise = np.random.laplace(loc=0, scale=1, size = 1)[0]
-#         loss += noise
-        return noise
+        return self.noise.loss_noise()
 
 
-def main(args):
+def setup_device(args):
     args.device_num = args.device
     device = torch.device(f'cuda:{args.device}' if args.device != 'cpu' else 'cpu')
     args.device = device
-    torch.manual_seed(0)
-    get_data = {"tp_fr": lambda : get_dataset("fr"),
-                "tp_de": lambda : get_dataset("de"),
-                "tp_dk": lambda : get_dataset("dk"),
-                "tp_us": lambda : get_dataset("us"),
-                "tp_uk": lambda : get_dataset("uk")
+    return device
+
+
+def load_data(args):
+    get_data = {"tp_fr": lambda : get_dataset("fr", args.tokenizer),
+                "tp_de": lambda : get_dataset("de", args.tokenizer),
+                "tp_dk": lambda : get_dataset("dk", args.tokenizer),
+                "tp_us": lambda : get_dataset("us", args.tokenizer),
+                "tp_uk": lambda : get_dataset("uk", args.tokenizer)
                 }
 
-    print("loading data...")
-    train, dev, test = get_data[args.dataset]()
+    def get_splits():
+        train, dev, test = get_data[args.dataset]()
+        if args.dedup is None and not args.group_by_user:
+            return train, dev, test
+        splits, pairs = deduplicate({"train": train, "dev": dev, "test": test}, remove=args.dedup != "flag",
+                                    user_groups=args.group_by_user, threshold=args.dedup_threshold)
+        print_dedup_report(splits, pairs, remove=args.dedup != "flag")
+        return splits["train"], splits["dev"], splits["test"]
 
-    print("building vocabulary...")
-    symbols = ["<g={}>".format(i) for i in ["F", "M"]] + ["<a={}>".format(i) for i in ["U", "O"]]
-    vocabulary = extract_vocabulary(train, add_symbols=symbols)
+    print("loading data...")
+    if args.corpus_dir is None:
+        if args.dataset == "bl":
+            raise ValueError("the blog corpus is read from the --corpus-dir written by python -m src.topics")
+        return get_splits()
+
+    # tokenized splits are cached once and then only appended to (see src.incremental)
+    cache = CorpusCache(args.corpus_dir)
+    if not cache.exists():
+        if args.dataset == "bl":
+            raise FileNotFoundError(f"{args.corpus_dir}: label the blog corpus first with python -m src.topics")
+        train, dev, test = get_splits()
+        cache.write({"train": train, "dev": dev, "test": test},
+                    meta={"classifier_output_size": len(get_classifier_labels(train)),
+                          "adversary_output_size": len(get_aux_labels(train)),
+                          "dataset": args.dataset, "tokenizer": args.tokenizer})
+        if args.shard_dir is None:
+            return train, dev, test
+    if args.shard_dir is not None:
+        # the training split stays on disk: main-task and adversary training stream it from the shards
+        return cache.split("train"), cache.load("dev"), cache.load("test")
+    return tuple(cache.load(split) for split in ["train", "dev", "test"])
+
+
+def build_model(args, train):
+    cache = CorpusCache(args.corpus_dir) if args.corpus_dir is not None else None
+    if cache is not None and cache.has_vocabulary():
+        # keep the word ids of the cached vocabulary, which may have been extended since
+        vocabulary = cache.load_vocabulary()
+    else:
+        print("building vocabulary...")
+        symbols = ["<g={}>".format(i) for i in ["F", "M"]] + ["<a={}>".format(i) for i in ["U", "O"]]
+        vocabulary = extract_vocabulary(train, add_symbols=symbols)
+        if cache is not None:
+            cache.save_vocabulary(vocabulary)
+
+    # output size, from the cache meta when there is one: the training split may stay on disk (--shard-dir),
+    # and every topic of the blog corpus is a class, even one without training post
+    if cache is not None:
+        meta = cache.meta()
+        classifier_output_size: int = meta["classifier_output_size"]
+        adversary_output_size: int = meta["adversary_output_size"]
+    else:
+        classifier_output_size: int = len(get_classifier_labels(train))
+        adversary_output_size: int = len(get_aux_labels(train))
+
+    return PrModel(args, vocabulary, classifier_output_size, adversary_output_size)
 
-    # output size
-    classifier_output_size: int = len(get_classifier_labels(train))
-    adversary_output_size: int = len(get_aux_labels(train))
 
-    mod = PrModel(args, vocabulary, classifier_output_size, adversary_output_size)
+def main(args):
+    setup_device(args)
+    torch.manual_seed(0)
+    if args.shard_dir is not None and args.corpus_dir is None:
+        raise ValueError("--shard-dir writes its shards from the corpus cache of --corpus-dir")
+    if args.is_add_raw_gradient_noise and args.is_add_gradient_noise:
+        raise ValueError("--is-add-raw-gradient-noise does not apply to the DP training of --is-add-gradient-noise")
+    train, dev, test = load_data(args)
+    mod = build_model(args, train)
+    if args.results_db is not None:
+        mod.results = ResultsStore(args.results_db)
+        mod.results.start_run(args)
     
-    mod.train_main(train, dev)
-    mod.train_adversarial(train, dev)
-    if args.is_influence_sample:
-        mod.evaluate_influence_sample(train, test)
+    try:
+        acc = mod.train_main(train, dev)
+        gender_acc, age_acc = mod.train_adversarial(train, dev)
+        if args.attack_zoo:
+            mod.evaluate_attack_zoo(train, dev)
+        if args.bootstrap > 0:
+            correctness = mod.evaluate_bootstrap(dev)
+            if args.correctness_out is not None:
+                torch.save(correctness, args.correctness_out)
+        if args.evaluate_test:
+            mod.evaluate_test(test)
+        if args.export_repr is not None:
+            os.makedirs(args.export_repr, exist_ok=True)
+            mod.evaluate_quantization(train, dev)
+        if args.knn_audit:
+            mod.evaluate_knn_audit(train, dev, test)
+        if args.is_influence_sample:
+            mod.evaluate_influence_sample(train, test)
+    except BaseException:
+        if mod.results is not None:
+            mod.results.finish_run(status="failed")
+        raise
+    finally:
+        mod.close()
+
+    if mod.results is not None:
+        mod.results.finish_run(task_acc=acc, gender_acc=gender_acc, age_acc=age_acc, epsilon=mod.epsilon)
+        mod.results.close()
     
 
 
-if __name__ == "__main__":
-    import argparse
-    import random
-    import numpy as np
-    import os
-    random.seed(10)
-    np.random.seed(10)
-    torch.manual_seed(0)
-    
+def get_parser():
     usage = """Implements the privacy evaluation protocol described in the article.
 
 (i) Trains a classifier to predict text labels (topic, sentiment)
@@ -399,24 +890,85 @@ if __name__ == "__main__":
     parser.add_argument("--char_seq_len", "-csl", type=int, default=150, help="Length of character sequence")
 
     # define model parameters
+    parser.add_argument("--encoder", default="bilstm", choices=list(ENCODERS), help="Encoder computing r(x), [default=bilstm]")
+    parser.add_argument("--cnn-kernel-size", type=int, default=3, help="Kernel size of the cnn encoder")
+    parser.add_argument("--lstm-checkpoint-chunk", type=int, default=0, help="Activation-checkpoint the BiLSTM over time chunks of this length, [default=0 (off)]")
+    parser.add_argument("--tbptt-chunk", type=int, default=0, help="Truncated BPTT: backpropagate through the last chunk of this length only, [default=0 (off)]")
     parser.add_argument("--char-embed-dim","-c", type=int, default=50, help="Dimension of char embeddings")
     parser.add_argument("--char-hidden-dim","-C", type=int, default=50, help="Dimension of char lstm")
     parser.add_argument("--word-embed-dim","-w", type=int, default=50, help="Dimension of word embeddings")
     parser.add_argument("--word-hidden-dim","-W", type=int, default=50, help="Dimension of word lstm")
 
+    parser.add_argument("--pretrained-vectors", type=str, default=None, help="Initialize word embeddings from this word2vec/fastText file")
+    parser.add_argument("--freeze-embedding", action="store_true", help="Do not train the word embeddings, [default=false]")
     parser.add_argument("--fc-dim","-l", type=int, default=50, help="Dimension of hidden layers")
     
     parser.add_argument("--device", "-d", type=str, default='cpu', help="Training device")
 
     parser.add_argument("--atraining", action="store_true", help="Adversarial classification defense (multidetasking)")
+    parser.add_argument("--adversary-weight", type=float, default=1.0, help="Scale of the reversed discriminator gradient for --atraining")
     parser.add_argument("--ptraining", action="store_true", help="Declustering defense")
+    parser.add_argument("--declustering-weight", type=float, default=1.0, help="Weight of the declustering loss for --ptraining")
+    parser.add_argument("--memory-bank-size", type=int, default=0, help="Recent representations kept for cross-batch declustering pairs, [default=0 (in-batch only)]")
         
     parser.add_argument("--is-add-loss-noise", action="store_true", help="Add noise to loss, [default=false]")
     parser.add_argument("--is-add-gradient-noise", action="store_true", help="Add noise to gradient, [default=false]")
+    parser.add_argument("--is-add-raw-gradient-noise", action="store_true", help="Add --noise-distribution noise to the gradients before every main classifier (and --atraining discriminator) step, without clipping or privacy accounting, [default=false]")
+    parser.add_argument("--attack-zoo", action="store_true", help="Also evaluate logistic, MLP and kNN attackers on cached representations, [default=false]")
+    parser.add_argument("--zoo-widths", type=int, nargs="+", default=[50, 100, 200], help="Hidden widths of the MLP attackers in the zoo")
+    parser.add_argument("--zoo-epochs", type=int, default=20, help="Training epochs of the attacker zoo")
+    parser.add_argument("--knn-k", type=int, default=10, help="Number of neighbours of the kNN attacker")
+    parser.add_argument("--knn-audit", action="store_true", help="kNN leakage and membership audit over an index of r(x), [default=false]")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="IVF lists of the kNN index, [default=0 (exact search)]")
+    parser.add_argument("--ivf-probe", type=int, default=8, help="IVF lists scanned per query")
+    parser.add_argument("--leakage-probe", action="store_true", help="Fit a closed-form linear attacker on a cached subsample every epoch, [default=false]")
+    parser.add_argument("--probe-size", type=int, default=1000, help="Train and dev examples of the leakage probe")
+    parser.add_argument("--selection", default="loss", choices=["loss", "utility-leakage"], help="Best main model: lowest val loss, or highest acc - leakage-weight * probe acc")
+    parser.add_argument("--leakage-weight", type=float, default=1.0, help="Weight of the probe leakage for --selection utility-leakage")
+    parser.add_argument("--export-repr", type=str, default=None, help="Export the train and dev r(x) to this directory (see src.repr_file)")
+    parser.add_argument("--repr-dtypes", nargs="+", default=["int8"], choices=list(DTYPES), help="Storage types of --export-repr, [default=int8]")
+    parser.add_argument("--quantization-study", action="store_true", help="Train an adversary on each --export-repr file and compare with float32, [default=false]")
+    parser.add_argument("--evaluate-test", action="store_true", help="Evaluate the main task, the adversary and the attack zoo on test in one encoder pass, [default=false]")
+    parser.add_argument("--test-report", type=str, default=None, help="Write the --evaluate-test report to this JSON file")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Bootstrap resamples of the final dev accuracies, [default=0 (off)]")
+    parser.add_argument("--correctness-out", type=str, default=None, help="Save the per-example correctness of --bootstrap, for paired comparisons")
+    parser.add_argument("--compare-to", type=str, default=None, help="Paired bootstrap of --bootstrap against the --correctness-out file of another run")
+    parser.add_argument("--target-epsilon", type=float, default=None, help="Derive the noise multiplier of --is-add-gradient-noise from this epsilon")
+    parser.add_argument("--noise-multiplier", type=float, default=1.1, help="Noise multiplier of --is-add-gradient-noise, ignored with --target-epsilon")
+    parser.add_argument("--l2-norm-clip", type=float, default=1.0, help="Per-example gradient clipping norm of --is-add-gradient-noise")
+    parser.add_argument("--delta", type=float, default=1e-5, help="Delta of --is-add-gradient-noise")
+    parser.add_argument("--dp-sampling", default="poisson", choices=dp_sampling.SCHEMES, help="Minibatch subsampling for --is-add-gradient-noise, [default=poisson]")
+    parser.add_argument("--noise-distribution", default="laplace", choices=DISTRIBUTIONS, help="Distribution of the loss/gradient noise, [default=laplace]")
+    parser.add_argument("--noise-scale", type=float, default=1.0, help="Scale of the loss/gradient noise")
+    parser.add_argument("--noise-seed", type=int, default=0, help="Seed of the loss/gradient noise generator")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS, help="Run forward passes in fp32 or bf16 autocast, [default=fp32]")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the encoder and attacker forward passes, [default=false]")
+    parser.add_argument("--async-validation", action="store_true", help="Validate weight snapshots in a background thread while the next epoch trains, [default=false]")
+    parser.add_argument("--checkpoint-dir", type=str, default=None, help="Write last/best checkpoints to this directory from a background writer")
+    parser.add_argument("--tokenizer", default="nltk", choices=list(TOKENIZERS), help="Word tokenizer of the reader: nltk word_tokenize or the compiled-regex Treebank tokenizer, [default=nltk]")
+    parser.add_argument("--dedup", default=None, choices=["flag", "remove"], help="Flag or remove near-duplicate reviews across splits (MinHash LSH)")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="Estimated Jaccard similarity of near-duplicates")
+    parser.add_argument("--group-by-user", action="store_true", help="Keep all reviews of a user_id in the same split, [default=false]")
+    parser.add_argument("--corpus-dir", type=str, default=None, help="Cache the tokenized splits and vocabulary in this directory")
+    parser.add_argument("--shard-dir", type=str, default=None, help="Stream the training split of the main task and the adversary from shards in this directory, written from --corpus-dir (see src.shards); the DP path still reads the cached split")
+    parser.add_argument("--shuffle-buffer", type=int, default=16384, help="Examples held by the shuffle buffer of --shard-dir")
+    parser.add_argument("--loader-workers", type=int, default=0, help="DataLoader workers reading the shards of --shard-dir")
+    parser.add_argument("--resume", action="store_true", help="Resume training from the last checkpoints in --checkpoint-dir, [default=false]")
+    parser.add_argument("--results-db", type=str, default=None, help="Record the run in this SQLite results store")
     parser.add_argument("--is-influence-sample", "-if", action="store_true", help="Evaluate influence, [default=false]")
     parser.add_argument("--use-char-lstm", action="store_true", help="Use a character LSTM, [default=false]")
-    
-    args = parser.parse_args()
+    return parser
+
+
+if __name__ == "__main__":
+    import random
+    import numpy as np
+    import os
+    random.seed(10)
+    np.random.seed(10)
+    torch.manual_seed(0)
+
+    args = get_parser().parse_args()
 
     main(args)
 
@@ -8,10 +8,14 @@ import torch.nn as nn
 from torch.autograd import Variable
 import torch.nn.functional as F
 
+from .encoders import build_encoder
+from ..vocabulary import PAD_I
+
 
 class MainClassifier(nn.Module):
     """
     Implements a BiLSTM based text classifier that utilizes both word and character embeddings.
+    The BiLSTM can be swapped for any encoder registered in models.encoders (args.encoder).
     Characters in each word are passed through an LSTM to generate an encoding.
     The character encoding is concatenated with the word embeddings for each word in the input
     and is fed through a BiLSTM to generate an intermediate representation which is
@@ -35,16 +39,15 @@ class MainClassifier(nn.Module):
         
         self.word_hidden_dim = args.word_hidden_dim 
         
-        self.num_layers = 2
         self.word_embedding = nn.Embedding(vocab_size, args.word_embed_dim)
-        self.bilstm = nn.LSTM(args.word_embed_dim, self.word_hidden_dim, bidirectional=True, num_layers = self.num_layers)
+        self.encoder = build_encoder(args.encoder, args)
         # self.bilstm = nn.LSTM(args.word_embed_dim + self.char_hidden_dim * 2, self.word_hidden_dim, bidirectional=True)
-        self.fc1 = nn.Linear(self.word_hidden_dim * 2, args.fc_dim)
+        self.hidden_size = self.encoder.hidden_size
+        self.fc1 = nn.Linear(self.hidden_size, args.fc_dim)
         self.relu = nn.ReLU()
         self.fc2 = nn.Linear(args.fc_dim, output_size)
         self.softmax = nn.Softmax(dim=-1)
 
-        self.hidden_size = self.word_hidden_dim * 2 
         self.seq_len = args.seq_len
         self.batch_size = args.batch_size
         self.device = args.device
@@ -67,25 +70,37 @@ class MainClassifier(nn.Module):
         if adversary:
             return last_hidden_state
 
+        return self.classify(last_hidden_state)
+
+    def forward_with_embed(self, sentence):
+        """
+        Runs the BiLSTM once and returns both the softmax output and the intermediate encoding r(x)
+        """
+        last_hidden_state = self.get_lstm_embed(sentence)
+        return self.classify(last_hidden_state), last_hidden_state
+
+    def classify(self, last_hidden_state):
         fc_output = self.fc1(last_hidden_state)
         fc_output = self.relu(fc_output)
         fc_output = self.fc2(fc_output)
-        fc_output = self.softmax(fc_output)
+        # keep the softmax (and the loss) in fp32 under bf16 autocast
+        fc_output = self.softmax(fc_output.float())
 #         print('fc_output',fc_output.shape)
         return fc_output
 
     def get_lstm_embed(self, sentence):
+        """
+        Args:
+            sentence (Tensor): word indices, shape (batch, seq_len) or (seq_len,)
+        Returns:
+            intermediate encoding r(x) computed by the selected encoder, shape (batch, hidden_size)
+        """
         if len(sentence.shape) == 1:
             sentence = sentence.view(1, sentence.shape[0])
-        word_embed = self.word_embedding(sentence).transpose(0,1)#.view(sentence_w.shape[1], sentence_w.shape[0], -1)
-        
-        h_w = torch.zeros(self.num_layers*2, sentence.shape[0], self.word_hidden_dim).to(self.device)
-        c_w = torch.zeros(self.num_layers*2, sentence.shape[0], self.word_hidden_dim).to(self.device)
-        
-        output , (hidden_state, cell_state) = self.bilstm(word_embed, (h_w, c_w))
-        output = output.transpose(0,1)#hidden_state[-2:].view(-1, self.word_hidden_dim * 2)
-        last_hidden_state = output[:,-1,:]
-        return last_hidden_state
+        word_embed = self.word_embedding(sentence)
+        return self.encoder(word_embed, sentence != PAD_I)
+
+    encode = get_lstm_embed
     
     def get_loss(self, sentence, target):
         loss = nn.CrossEntropyLoss()
@@ -109,16 +124,62 @@ class MainClassifier(nn.Module):
         else: 
             return loss(output, target.view(-1)), torch.argmax(output, dim=1)
 
+    def get_loss_prediction_embed(self, sentence, target):
+        """
+        Same as get_loss_prediction, but also returns r(x) so that defenses can reuse it
+        without a second BiLSTM pass
+        """
+        loss = nn.CrossEntropyLoss()
+        output, last_hidden_state = self.forward_with_embed(sentence)
+        return loss(output, target.view(-1)), torch.argmax(output, dim=1), last_hidden_state
+
+    def grow_embedding(self, vocab_size):
+        """
+        Grows word_embedding in place to vocab_size rows, for words appended to the vocabulary.
+        Existing rows are kept and the Parameter object stays the same.
+        """
+        weight = self.word_embedding.weight
+        if vocab_size <= weight.shape[0]:
+            return
+        new_rows = torch.empty(vocab_size - weight.shape[0], weight.shape[1], dtype=weight.dtype, device=weight.device)
+        nn.init.normal_(new_rows)
+        weight.data = torch.cat([weight.data, new_rows])
+        self.word_embedding.num_embeddings = vocab_size
+
     def freeze_parameters(self):
         for p in self.parameters():
             p.requires_grad = False
 
     def weight_init(self):
-        for param in self.bilstm.parameters():
-            if len(param.shape) >= 2:
-                nn.init.orthogonal_(param.data)
-            else:
-                nn.init.normal_(param.data)
+        # last, as before the encoder registry, so seeded runs draw the same initial weights
+        if hasattr(self.encoder, "weight_init"):
+            self.encoder.weight_init()
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before the encoder registry hold the BiLSTM at bilstm.* instead of encoder.bilstm.*
+        for key in [k for k in state_dict if k.startswith(prefix + "bilstm.")]:
+            state_dict[prefix + "encoder." + key[len(prefix):]] = state_dict.pop(key)
+        super(MainClassifier, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+
+class GradientReversal(torch.autograd.Function):
+    """
+    Identity in the forward pass, multiplies the gradient by -scale in the backward pass.
+    Lets the discriminator minimize its loss while the encoder maximizes it in a single backward.
+    """
+    @staticmethod
+    def forward(ctx, hidden_state, scale):
+        ctx.scale = scale
+        return hidden_state.view_as(hidden_state)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        return grad_output.neg() * ctx.scale, None
+
+
+def grad_reverse(hidden_state, scale=1.0):
+    return GradientReversal.apply(hidden_state, scale)
+
 
 class AdversaryClassifier(nn.Module):
     """
@@ -147,7 +208,8 @@ class AdversaryClassifier(nn.Module):
         fc_output = self.fc1(hidden_state)
         fc_output = self.relu(fc_output)
         fc_output = self.fc2(fc_output)
-        fc_output = self.sigmoid(fc_output)
+        # keep the sigmoid (and the BCE loss) in fp32 under bf16 autocast
+        fc_output = self.sigmoid(fc_output.float())
         return fc_output
     
     def get_loss(self, hidden_state, target):
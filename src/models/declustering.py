@@ -0,0 +1,84 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class DeclusteringLoss(nn.Module):
+    """
+    Implements the declustering defense as a batched regularizer on the intermediate representations.
+    Examples are grouped by their private variables (aux bitmask). For each example, the mean distance
+    to examples with other private variables should not exceed the mean distance to examples sharing
+    them, i.e. r(x) should not cluster by private variables.
+    All pairwise distances are computed at once with torch.cdist; an optional memory bank of recent
+    (detached) representations adds cross-batch pairs.
+    """
+
+    def __init__(self, hidden_size, aux_size, bank_size=0):
+        """
+        Args:
+            hidden_size (int): Dimensions of the intermediate representation
+            aux_size (int): Number of binary private variables
+            bank_size (int): Number of recent representations kept for cross-batch pairs (0 disables)
+        """
+        super(DeclusteringLoss, self).__init__()
+        self.bank_size = bank_size
+        self.register_buffer('powers', 2 ** torch.arange(aux_size))
+        self.register_buffer('bank', torch.zeros(bank_size, hidden_size))
+        self.register_buffer('bank_codes', torch.full((bank_size,), -1, dtype=torch.long))
+        self.bank_ptr = 0
+
+    def encode_aux(self, aux):
+        """
+        Maps each aux bitmask row to a single integer group id
+        """
+        return (aux.long() * self.powers).sum(dim=-1)
+
+    def forward(self, hidden_state, aux):
+        """
+        Args:
+            hidden_state (Tensor): batch of r(x), shape (batch, hidden_size)
+            aux (Tensor): batch of aux bitmasks, shape (batch, aux_size)
+        Returns:
+            scalar declustering loss
+        """
+        codes = self.encode_aux(aux)
+        dist = torch.cdist(hidden_state, hidden_state)
+        same = codes[:, None] == codes[None, :]
+        valid = ~torch.eye(len(codes), dtype=torch.bool, device=codes.device)
+
+        if self.bank_size > 0:
+            filled = self.bank_codes >= 0
+            bank, bank_codes = self.bank[filled], self.bank_codes[filled]
+            dist = torch.cat([dist, torch.cdist(hidden_state, bank)], dim=1)
+            same = torch.cat([same, codes[:, None] == bank_codes[None, :]], dim=1)
+            valid = torch.cat([valid, torch.ones(len(codes), len(bank_codes), dtype=torch.bool, device=codes.device)], dim=1)
+
+        same = (same & valid).float()
+        diff = (~(same.bool()) & valid).float()
+        n_same, n_diff = same.sum(dim=1), diff.sum(dim=1)
+        same_mean = (dist * same).sum(dim=1) / n_same.clamp(min=1)
+        diff_mean = (dist * diff).sum(dim=1) / n_diff.clamp(min=1)
+
+        self.enqueue(hidden_state.detach(), codes)
+
+        has_pairs = (n_same > 0) & (n_diff > 0)
+        if not has_pairs.any():
+            return hidden_state.sum() * 0
+        return F.relu(diff_mean - same_mean)[has_pairs].mean()
+
+    def get_extra_state(self):
+        # the bank buffers are in the state dict, its write position too so a resumed run overwrites the oldest
+        return {"bank_ptr": self.bank_ptr}
+
+    def set_extra_state(self, state):
+        self.bank_ptr = state["bank_ptr"]
+
+    @torch.no_grad()
+    def enqueue(self, hidden_state, codes):
+        if self.bank_size == 0:
+            return
+        n = min(len(codes), self.bank_size)
+        idx = (self.bank_ptr + torch.arange(n, device=codes.device)) % self.bank_size
+        self.bank[idx] = hidden_state[-n:]
+        self.bank_codes[idx] = codes[-n:]
+        self.bank_ptr = (self.bank_ptr + n) % self.bank_size
@@ -0,0 +1,147 @@
+"""
+Encoders mapping embedded word sequences to the intermediate representation r(x).
+
+Every encoder takes word embeddings of shape (batch, seq_len, word_embed_dim) and the mask of
+non-padding tokens, and returns r(x) of shape (batch, hidden_size). New encoders are added to
+ENCODERS with the register_encoder decorator and become selectable with --encoder.
+"""
+from functools import partial
+
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
+
+
+ENCODERS = {}
+
+
+def register_encoder(name):
+    def register(cls):
+        ENCODERS[name] = cls
+        return cls
+    return register
+
+
+def build_encoder(name, args):
+    return ENCODERS[name](args)
+
+
+@register_encoder("bilstm")
+class BiLSTMEncoder(nn.Module):
+    """
+    2-layer BiLSTM, r(x) is the output at the last position.
+
+    For long sequences the layers can be run one direction at a time over time chunks:
+      * checkpoint_chunk: every (layer, direction, chunk) is activation-checkpointed, so only the chunk
+        inputs and boundary states are kept and each chunk is recomputed once in the backward pass.
+      * tbptt_chunk: truncated BPTT, gradients only flow through the last chunk; the recurrent state
+        entering it is computed without a graph, so memory no longer grows with seq_len.
+    """
+
+    def __init__(self, args):
+        super(BiLSTMEncoder, self).__init__()
+        self.word_hidden_dim = args.word_hidden_dim
+        self.num_layers = 2
+        self.bilstm = nn.LSTM(args.word_embed_dim, self.word_hidden_dim, bidirectional=True, num_layers=self.num_layers)
+        self.hidden_size = self.word_hidden_dim * 2
+        self.checkpoint_chunk = args.lstm_checkpoint_chunk
+        self.tbptt_chunk = args.tbptt_chunk
+
+    def forward(self, word_embed, mask):
+        word_embed = word_embed.transpose(0, 1)
+        if (self.tbptt_chunk > 0 or self.checkpoint_chunk > 0) and self.training and torch.is_grad_enabled():
+            return self.chunked_forward(word_embed)[-1]
+        h_w = torch.zeros(self.num_layers*2, word_embed.shape[1], self.word_hidden_dim, device=word_embed.device)
+        c_w = torch.zeros(self.num_layers*2, word_embed.shape[1], self.word_hidden_dim, device=word_embed.device)
+
+        output, (hidden_state, cell_state) = self.bilstm(word_embed, (h_w, c_w))
+        output = output.transpose(0, 1)
+        return output[:, -1, :]
+
+    def layer_params(self, layer, reverse):
+        suffix = "_reverse" if reverse else ""
+        return [getattr(self.bilstm, f"{name}_l{layer}{suffix}") for name in ["weight_ih", "weight_hh", "bias_ih", "bias_hh"]]
+
+    def run_chunk(self, params, reverse, chunk, h, c):
+        if reverse:
+            chunk = chunk.flip(0)
+        output, h, c = torch.lstm(chunk, (h, c), params, True, 1, 0., self.training, False, False)
+        if reverse:
+            output = output.flip(0)
+        return output, h, c
+
+    def run_direction(self, layer_input, layer, reverse):
+        chunk_len = self.tbptt_chunk if self.tbptt_chunk > 0 else self.checkpoint_chunk
+        chunks = layer_input.split(chunk_len, dim=0)
+        params = self.layer_params(layer, reverse)
+        h = torch.zeros(1, layer_input.shape[1], self.word_hidden_dim, device=layer_input.device, dtype=layer_input.dtype)
+        c = torch.zeros_like(h)
+
+        outputs = [None] * len(chunks)
+        order = range(len(chunks) - 1, -1, -1) if reverse else range(len(chunks))
+        for k in order:
+            run = partial(self.run_chunk, params, reverse)
+            if self.tbptt_chunk > 0 and k != len(chunks) - 1:
+                # r(x) is read at the last position: only the last chunk keeps its graph
+                with torch.no_grad():
+                    outputs[k], h, c = run(chunks[k], h, c)
+            elif self.checkpoint_chunk > 0 and torch.is_grad_enabled():
+                outputs[k], h, c = checkpoint(run, chunks[k], h, c, use_reentrant=False)
+            else:
+                outputs[k], h, c = run(chunks[k], h, c)
+        return torch.cat(outputs, dim=0)
+
+    def chunked_forward(self, word_embed):
+        """
+        Same computation as self.bilstm, one (layer, direction) at a time over time chunks
+        """
+        layer_input = word_embed
+        for layer in range(self.num_layers):
+            layer_input = torch.cat([self.run_direction(layer_input, layer, False),
+                                     self.run_direction(layer_input, layer, True)], dim=2)
+        return layer_input
+
+    def weight_init(self):
+        # called by MainClassifier once its own layers are built
+        for param in self.bilstm.parameters():
+            if len(param.shape) >= 2:
+                nn.init.orthogonal_(param.data)
+            else:
+                nn.init.normal_(param.data)
+
+
+@register_encoder("cnn")
+class CNNEncoder(nn.Module):
+    """
+    1-D convolution over the word embeddings followed by a max-pool over the (non-padding) positions
+    """
+
+    def __init__(self, args):
+        super(CNNEncoder, self).__init__()
+        self.hidden_size = args.word_hidden_dim * 2
+        self.conv = nn.Conv1d(args.word_embed_dim, self.hidden_size, args.cnn_kernel_size, padding=args.cnn_kernel_size // 2)
+        self.relu = nn.ReLU()
+
+    def forward(self, word_embed, mask):
+        output = self.relu(self.conv(word_embed.transpose(1, 2)))[:, :, :mask.shape[1]]
+        # relu outputs are >= 0, so zeroing the padding positions leaves the max unchanged
+        output = output * mask.unsqueeze(1).to(output.dtype)
+        return output.max(dim=2).values
+
+
+@register_encoder("bag")
+class BagEncoder(nn.Module):
+    """
+    Mean of the (non-padding) word embeddings, projected to hidden_size
+    """
+
+    def __init__(self, args):
+        super(BagEncoder, self).__init__()
+        self.hidden_size = args.word_hidden_dim * 2
+        self.fc = nn.Linear(args.word_embed_dim, self.hidden_size)
+        self.tanh = nn.Tanh()
+
+    def forward(self, word_embed, mask):
+        mask = mask.unsqueeze(2).to(word_embed.dtype)
+        mean = (word_embed * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return self.tanh(self.fc(mean))
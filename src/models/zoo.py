@@ -0,0 +1,67 @@
+import math
+
+import torch
+import torch.nn as nn
+
+
+class BatchedMLPAttacker(nn.Module):
+    """
+    Several one-hidden-layer MLP attackers of different widths stacked into a single model.
+    Weights are padded to the largest width and masked, so every attacker sees the same minibatch
+    in one batched matmul (torch.baddbmm) instead of one forward per attacker.
+    """
+
+    def __init__(self, hidden_state_size, widths, output_size):
+        """
+        Args:
+            hidden_state_size (int): Dimensions of the intermediate representation
+            widths (list): Hidden layer width of each attacker
+            output_size (int): Number of binary private variables
+        """
+        super(BatchedMLPAttacker, self).__init__()
+        self.widths = list(widths)
+        n, max_width = len(self.widths), max(self.widths)
+
+        self.w1 = nn.Parameter(torch.empty(n, hidden_state_size, max_width))
+        self.b1 = nn.Parameter(torch.empty(n, 1, max_width))
+        self.w2 = nn.Parameter(torch.empty(n, max_width, output_size))
+        self.b2 = nn.Parameter(torch.empty(n, 1, output_size))
+        mask = torch.zeros(n, 1, max_width)
+        for i, width in enumerate(self.widths):
+            mask[i, :, :width] = 1
+        self.register_buffer('mask', mask)
+        self.output_size = output_size
+
+        self.weight_init(hidden_state_size)
+
+    def weight_init(self, hidden_state_size):
+        # same ranges as nn.Linear, per attacker
+        bound = 1 / math.sqrt(hidden_state_size)
+        nn.init.uniform_(self.w1, -bound, bound)
+        nn.init.uniform_(self.b1, -bound, bound)
+        for i, width in enumerate(self.widths):
+            bound = 1 / math.sqrt(width)
+            nn.init.uniform_(self.w2[i], -bound, bound)
+            nn.init.uniform_(self.b2[i], -bound, bound)
+
+    def forward(self, hidden_state):
+        """
+        Args:
+            hidden_state (Tensor): batch of r(x), shape (batch, hidden_state_size)
+        Returns:
+            logits of every attacker, shape (n_attackers, batch, output_size)
+        """
+        hidden_state = hidden_state.expand(len(self.widths), -1, -1)
+        fc_output = torch.baddbmm(self.b1, hidden_state, self.w1)
+        fc_output = torch.relu(fc_output) * self.mask
+        return torch.baddbmm(self.b2, fc_output, self.w2)
+
+    def get_loss(self, hidden_state, target):
+        output = self(hidden_state)
+        target = target.float().expand_as(output)
+        loss_function = nn.BCEWithLogitsLoss(reduction='none')
+        # mean per attacker, summed over attackers so their gradients stay independent
+        return loss_function(output, target).mean(dim=(1, 2)).sum()
+
+    def get_prediction(self, hidden_state):
+        return (self(hidden_state) >= 0).long()
@@ -0,0 +1,67 @@
+"""
+On-device noise for the loss/gradient noise defenses.
+
+Noise is sampled in place with a seeded torch.Generator on the parameters' device and dtype,
+into one flat buffer covering all parameters, so a step costs one RNG kernel instead of one
+NumPy draw and host-to-device copy per parameter.
+"""
+from collections import defaultdict
+
+import torch
+
+
+DISTRIBUTIONS = ["laplace", "gaussian"]
+
+
+class NoiseInjector:
+    def __init__(self, params, device, distribution="laplace", scale=1.0, seed=0):
+        """
+        Args:
+            params (iterable): Parameters whose gradients get noise
+            device: Device of the parameters
+            distribution (str): "laplace" or "gaussian"
+            scale (float): Laplace scale b / Gaussian standard deviation
+            seed (int): Seed of the noise generator, for reproducible runs
+        """
+        assert distribution in DISTRIBUTIONS, f"unknown noise distribution {distribution}"
+        self.params = [p for p in params if p.requires_grad]
+        self.device = torch.device(device)
+        self.distribution = distribution
+        self.scale = scale
+        self.generator = torch.Generator(device=self.device)
+        self.generator.manual_seed(seed)
+        self._buffers = {}
+
+    def sample_(self, out):
+        """
+        Fills `out` in place with noise
+        """
+        if self.distribution == "gaussian":
+            return out.normal_(0, self.scale, generator=self.generator)
+        # inverse CDF of the Laplace distribution: -b * sign(u) * log(1 - 2|u|), u ~ U(-1/2, 1/2)
+        out.uniform_(-0.5, 0.5, generator=self.generator)
+        sign = out.sign()
+        # uniform_ can return -1/2 exactly, which would give log(0): keep |u| in the open interval
+        out.abs_().clamp_(max=0.5 - torch.finfo(out.dtype).eps)
+        return out.mul_(-2).log1p_().mul_(sign).mul_(-self.scale)
+
+    def _buffer(self, dtype, numel):
+        buffer = self._buffers.get(dtype)
+        if buffer is None or buffer.numel() != numel:
+            buffer = torch.empty(numel, dtype=dtype, device=self.device)
+            self._buffers[dtype] = buffer
+        return buffer
+
+    @torch.no_grad()
+    def add_gradient_noise(self):
+        grads = defaultdict(list)
+        for p in self.params:
+            if p.grad is not None:
+                grads[p.grad.dtype].append(p.grad)
+        for dtype, group in grads.items():
+            noise = self.sample_(self._buffer(dtype, sum(g.numel() for g in group)))
+            for g, n in zip(group, noise.split([g.numel() for g in group])):
+                g.add_(n.view_as(g))
+
+    def loss_noise(self, dtype=torch.float32):
+        return self.sample_(torch.empty((), dtype=dtype, device=self.device))
@@ -0,0 +1,33 @@
+"""
+Optional dependencies, imported only when the flag that needs them is set.
+"""
+import importlib
+
+
+INSTALL = {
+    "pyvacy": "pip install git+https://github.com/ChrisWaites/pyvacy.git",
+    "pytorch_influence_functions": "pip install git+https://github.com/BirkhoffG/pytorch_influence_functions.git",
+    "sklearn": "pip install scikit-learn",
+}
+
+
+def require(name, flag):
+    """
+    Imports module `name`, needed by the command-line flag `flag`
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        package = name.split(".")[0]
+        raise ImportError(f"{flag} requires {package}: {INSTALL.get(package, f'pip install {package}')}") from e
+
+
+def progress(iterable):
+    """
+    tqdm progress bar if tqdm is installed
+    """
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        return iterable
+    return tqdm(iterable)
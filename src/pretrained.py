@@ -0,0 +1,132 @@
+"""
+Pretrained word vectors (word2vec / fastText) for initializing MainClassifier.word_embedding.
+
+A vector file is converted once into a memory-mapped float32 matrix ({path}.npy) and an index of
+its words ({path}.words, one per line, in row order). The index is read once per process into a
+dict, so initializing an embedding costs one lookup per vocabulary word and a single gather of
+their rows from the memory map: a multi-GB vector file costs seconds and little RAM.
+"""
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+import torch
+
+
+def _parse_header(line):
+    parts = line.split()
+    if len(parts) == 2 and all(p.isdigit() for p in parts):
+        return int(parts[0]), int(parts[1])
+    return None
+
+
+def _convert_text(path, prefix):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        header = _parse_header(f.readline())
+    if header is None:
+        # no "n dim" header (e.g. GloVe-style files): count rows and read dim from the first one
+        with open(path, encoding="utf-8", errors="replace") as f:
+            first = f.readline().rstrip().split(" ")
+            n = 1 + sum(1 for _ in f)
+        header = (n, len(first) - 1)
+    n, dim = header
+
+    vectors = np.lib.format.open_memmap(prefix + ".npy", mode="w+", dtype=np.float32, shape=(n, dim))
+    rows = 0
+    with open(path, encoding="utf-8", errors="replace") as f, open(prefix + ".words", "w", encoding="utf-8") as out:
+        for line in f:
+            parts = line.rstrip().split(" ")
+            if len(parts) != dim + 1:
+                continue
+            vectors[rows] = np.asarray(parts[1:], dtype=np.float32)
+            out.write(parts[0] + "\n")
+            rows += 1
+    vectors.flush()
+    return rows, dim
+
+
+def _convert_binary(path, prefix):
+    with open(path, "rb") as f:
+        n, dim = _parse_header(f.readline().decode())
+        vectors = np.lib.format.open_memmap(prefix + ".npy", mode="w+", dtype=np.float32, shape=(n, dim))
+        with open(prefix + ".words", "w", encoding="utf-8") as out:
+            for row in range(n):
+                word = bytearray()
+                while True:
+                    c = f.read(1)
+                    if c == b" " or c == b"":
+                        break
+                    if c != b"\n":
+                        word.extend(c)
+                out.write(word.decode("utf-8", errors="replace") + "\n")
+                vectors[row] = np.frombuffer(f.read(4 * dim), dtype=np.float32)
+    vectors.flush()
+    return n, dim
+
+
+def convert_vectors(path, prefix=None):
+    """
+    Converts a word2vec/fastText file (text, or word2vec binary for *.bin) to {prefix}.npy + {prefix}.words.
+    Does nothing if the converted files already exist. Returns the prefix.
+    """
+    prefix = path if prefix is None else prefix
+    if os.path.exists(prefix + ".npy") and os.path.exists(prefix + ".words"):
+        return prefix
+    start = time.perf_counter()
+    if path.endswith(".bin"):
+        n, dim = _convert_binary(path, prefix)
+    else:
+        n, dim = _convert_text(path, prefix)
+    print(f"[pretrained] converted {n} vectors of dim {dim} in {time.perf_counter() - start:.1f}s")
+    return prefix
+
+
+@lru_cache(maxsize=None)
+def load_index(prefix):
+    """
+    word -> row of the converted vectors (the first row of a repeated word)
+    """
+    index = {}
+    with open(prefix + ".words", encoding="utf-8") as f:
+        for row, word in enumerate(f.read().split("\n")[:-1]):
+            index.setdefault(word, row)
+    return index
+
+
+def gather_vectors(prefix, words):
+    """
+    Rows of the converted vectors for `words`, matching exactly or else lowercased.
+
+    Returns:
+        (ids, vectors): positions in `words` that were found, and their vectors (len(ids), dim)
+    """
+    index = load_index(prefix)
+    rows = np.fromiter((index.get(w, index.get(w.lower(), -1)) for w in words), dtype=np.int64, count=len(words))
+    ids = np.flatnonzero(rows >= 0)
+    rows = rows[ids]
+
+    vectors = np.load(prefix + ".npy", mmap_mode="r")
+    # one sorted fancy-index gather over the memory map, then back to the ids' order
+    order = np.argsort(rows)
+    gathered = np.empty((len(rows), vectors.shape[1]), dtype=np.float32)
+    gathered[order] = vectors[rows[order]]
+    return ids, gathered
+
+
+def init_embedding(embedding, words, path, freeze=False):
+    """
+    Initializes the rows of `embedding` (nn.Embedding over `words`) found in the vector file `path`.
+    With freeze, the embedding gets no gradients at all.
+    """
+    start = time.perf_counter()
+    prefix = convert_vectors(path)
+    ids, vectors = gather_vectors(prefix, words)
+    if vectors.shape[1] != embedding.embedding_dim:
+        raise ValueError(f"{path} has vectors of dim {vectors.shape[1]}, --word-embed-dim is {embedding.embedding_dim}")
+    with torch.no_grad():
+        embedding.weight[torch.from_numpy(ids).to(embedding.weight.device)] = \
+            torch.from_numpy(vectors).to(embedding.weight.device, embedding.weight.dtype)
+    if freeze:
+        embedding.weight.requires_grad_(False)
+    print(f"[pretrained] {len(ids)}/{len(words)} words initialized from {path} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,57 @@
+"""
+Cheap online leakage probe, run alongside validation during main-task training.
+
+A fixed subsample of train and dev reviews is encoded once into word-id tensors. At each probe
+the current encoder computes r(x) for them, a ridge-regression linear attacker is fitted in
+closed form on the train part and its accuracy on each private variable is measured on the dev part.
+"""
+import random
+
+import torch
+
+from .dataset import AttackDataset
+
+
+class LeakageProbe:
+    def __init__(self, train, dev, vocabulary, seq_len, aux_size, device, size=1000, ridge=1e-2, seed=0):
+        """
+        Args:
+            train, dev (list): Examples the fixed subsamples are drawn from
+            size (int): Number of examples drawn from each split
+            ridge (float): L2 regularization of the linear attacker, relative to the mean feature variance
+        """
+        rng = random.Random(seed)
+        self.device = device
+        self.ridge = ridge
+        self.train = self._encode(rng.sample(train, min(size, len(train))), vocabulary, seq_len, aux_size)
+        self.dev = self._encode(rng.sample(dev, min(size, len(dev))), vocabulary, seq_len, aux_size)
+
+    def _encode(self, examples, vocabulary, seq_len, aux_size):
+        dataset = AttackDataset(examples, vocabulary, seq_len, aux_size)
+        input_vec, target = zip(*[dataset[i] for i in range(len(dataset))])
+        return torch.stack(input_vec).to(self.device), torch.stack(target).to(self.device)
+
+    def _hidden(self, model, input_vec, batch_size=512):
+        return torch.cat([model.get_lstm_embed(input_vec[s:s + batch_size]).float()
+                          for s in range(0, len(input_vec), batch_size)])
+
+    @torch.no_grad()
+    def __call__(self, model):
+        """
+        Returns:
+            accuracy (%) of the linear attacker on each private variable, on the dev subsample
+        """
+        model.eval()
+        train_hidden, train_target = self._hidden(model, self.train[0]), self.train[1]
+        dev_hidden, dev_target = self._hidden(model, self.dev[0]), self.dev[1]
+
+        mean, std = train_hidden.mean(dim=0), train_hidden.std(dim=0).clamp(min=1e-6)
+        x = torch.cat([(train_hidden - mean) / std, torch.ones(len(train_hidden), 1, device=self.device)], dim=1)
+        y = train_target.float() * 2 - 1
+        gram = x.t() @ x
+        gram += self.ridge * len(x) * torch.eye(x.shape[1], device=self.device)
+        weight = torch.linalg.solve(gram, x.t() @ y)
+
+        x_dev = torch.cat([(dev_hidden - mean) / std, torch.ones(len(dev_hidden), 1, device=self.device)], dim=1)
+        predicts = (x_dev @ weight > 0).long()
+        return [round(acc * 100, 3) for acc in (predicts == dev_target).float().mean(dim=0).tolist()]
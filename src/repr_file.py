@@ -0,0 +1,138 @@
+"""
+Compact on-disk format for exported representations r(x).
+
+    [header: magic, JSON metadata, padded to HEADER_SIZE bytes]
+    [chunk 0: scale float32 (dim) | aux uint8 (chunk_rows, aux_size) | r(x) (chunk_rows, dim)]
+    [chunk 1: ...]
+
+r(x) is stored as float32, float16 or int8, divided by a per-dimension scale (the absolute maximum of
+the dimension within the chunk), so int8 keeps 8 bits per dimension whatever the range of each unit.
+The last chunk is zero-padded, so all chunks have the same size: the file is memory-mapped and viewed
+as strided (n_chunks, chunk_rows, dim) arrays without copying, and only the rows of a batch are read
+and dequantized.
+"""
+import hashlib
+import json
+
+import numpy as np
+import torch
+
+
+MAGIC = b"PRREPR1\n"
+HEADER_SIZE = 4096
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def model_hash(model):
+    digest = hashlib.sha256()
+    for name, tensor in sorted(model.state_dict().items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().float().cpu().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+class RepresentationWriter:
+    def __init__(self, filename, dim, aux_size, dtype="int8", chunk_rows=4096, **meta):
+        """
+        Args:
+            dtype (str): float32, float16 or int8
+            meta: Extra metadata of the header (model hash, dataset, split, ...)
+        """
+        # keeps every array of a chunk aligned on its itemsize
+        assert chunk_rows % 8 == 0, "chunk_rows must be a multiple of 8"
+        self.f = open(filename, "wb")
+        self.dim = dim
+        self.aux_size = aux_size
+        self.dtype = dtype
+        self.chunk_rows = chunk_rows
+        self.meta = meta
+        self.n = 0
+        self.n_chunks = 0
+        self.hidden, self.aux = [], []
+        self.buffered = 0
+        self.f.write(b"\0" * HEADER_SIZE)
+
+    def write(self, hidden_state, aux):
+        """
+        Appends a batch of r(x) (n, dim) and aux bitmasks (n, aux_size)
+        """
+        self.hidden.append(hidden_state.detach().float().cpu().numpy())
+        self.aux.append(aux.detach().cpu().numpy().astype(np.uint8))
+        self.buffered += len(hidden_state)
+        self.n += len(hidden_state)
+        while self.buffered >= self.chunk_rows:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        hidden, aux = np.concatenate(self.hidden), np.concatenate(self.aux)
+        rows = min(self.chunk_rows, len(hidden))
+        self.hidden, self.aux = [hidden[rows:]], [aux[rows:]]
+        self.buffered = len(hidden) - rows
+        hidden, aux = hidden[:rows], aux[:rows]
+        if rows < self.chunk_rows:
+            hidden = np.concatenate([hidden, np.zeros((self.chunk_rows - rows, self.dim), dtype=np.float32)])
+            aux = np.concatenate([aux, np.zeros((self.chunk_rows - rows, self.aux_size), dtype=np.uint8)])
+
+        scale = np.abs(hidden).max(axis=0)
+        if self.dtype == "int8":
+            scale = scale / 127
+        scale = np.where(scale > 0, scale, 1).astype(np.float32)
+        quantized = hidden / scale
+        if self.dtype == "int8":
+            quantized = np.rint(quantized)
+        self.f.write(scale.tobytes())
+        self.f.write(np.ascontiguousarray(aux).tobytes())
+        self.f.write(quantized.astype(DTYPES[self.dtype]).tobytes())
+        self.n_chunks += 1
+
+    def close(self):
+        if self.buffered > 0:
+            self._flush_chunk()
+        header = dict(self.meta, n=self.n, dim=self.dim, aux_size=self.aux_size, dtype=self.dtype,
+                      chunk_rows=self.chunk_rows, n_chunks=self.n_chunks)
+        header = MAGIC + json.dumps(header).encode("utf-8")
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"metadata does not fit in {HEADER_SIZE} bytes")
+        self.f.seek(0)
+        self.f.write(header)
+        self.f.close()
+
+
+class RepresentationFile:
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if not header.startswith(MAGIC):
+            raise ValueError(f"{filename} is not a representation file")
+        self.meta = json.loads(header[len(MAGIC):].rstrip(b"\0").decode("utf-8"))
+        self.n, self.dim, self.aux_size = self.meta["n"], self.meta["dim"], self.meta["aux_size"]
+        self.dtype = np.dtype(DTYPES[self.meta["dtype"]])
+        rows, chunks = self.meta["chunk_rows"], self.meta["n_chunks"]
+        self.chunk_rows = rows
+
+        data = np.memmap(filename, dtype=np.uint8, mode="r")
+        chunk_bytes = self.dim * 4 + rows * self.aux_size + rows * self.dim * self.dtype.itemsize
+        base = data[HEADER_SIZE:]
+        # zero-copy strided views over all the chunks
+        self.scale = np.ndarray((chunks, self.dim), dtype=np.float32, buffer=base, strides=(chunk_bytes, 4))
+        self.aux = np.ndarray((chunks, rows, self.aux_size), dtype=np.uint8, buffer=base, offset=self.dim * 4,
+                              strides=(chunk_bytes, self.aux_size, 1))
+        self.hidden = np.ndarray((chunks, rows, self.dim), dtype=self.dtype, buffer=base,
+                                 offset=self.dim * 4 + rows * self.aux_size,
+                                 strides=(chunk_bytes, self.dim * self.dtype.itemsize, self.dtype.itemsize))
+
+    def __len__(self):
+        return self.n
+
+    def get(self, index):
+        """
+        Dequantized r(x) (float32 tensor) and aux bitmasks of the rows `index` (array of row numbers)
+        """
+        chunk, row = np.divmod(np.asarray(index), self.chunk_rows)
+        hidden = torch.from_numpy(self.hidden[chunk, row].astype(np.float32)) * torch.from_numpy(self.scale[chunk])
+        return hidden, torch.from_numpy(self.aux[chunk, row].astype(np.int64))
+
+    def batches(self, batch_size, shuffle=False, generator=None):
+        order = torch.randperm(self.n, generator=generator).numpy() if shuffle else np.arange(self.n)
+        for start in range(0, self.n, batch_size):
+            yield self.get(order[start:start + batch_size])
@@ -0,0 +1,208 @@
+"""
+SQLite store of experiment results.
+
+Every run records its configuration, per-epoch metrics and final privacy/utility numbers.
+Any number of worker processes can write to the same file: the database runs in WAL mode with
+a busy timeout, and epoch metrics are buffered and written in batched transactions.
+
+    python -m src.results_store results.db pareto --dataset tp_us
+    python -m src.results_store results.db runs
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset TEXT NOT NULL,
+    defense TEXT NOT NULL,
+    host TEXT,
+    pid INTEGER,
+    started REAL NOT NULL,
+    finished REAL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_dataset_defense ON runs (dataset, defense);
+
+CREATE TABLE IF NOT EXISTS configs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (run_id, key)
+);
+CREATE INDEX IF NOT EXISTS configs_key_value ON configs (key, value);
+
+CREATE TABLE IF NOT EXISTS epoch_metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    phase TEXT NOT NULL,
+    epoch INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, phase, epoch, metric)
+);
+
+CREATE TABLE IF NOT EXISTS final_metrics (
+    run_id INTEGER PRIMARY KEY REFERENCES runs (id),
+    task_acc REAL,
+    gender_acc REAL,
+    age_acc REAL,
+    epsilon REAL
+);
+"""
+
+LEAKAGE = {
+    "max": "MAX(f.gender_acc, f.age_acc)",
+    "mean": "(f.gender_acc + f.age_acc) / 2",
+    "gender": "f.gender_acc",
+    "age": "f.age_acc",
+}
+
+
+def get_defense(args):
+    """
+    Short name of the defenses enabled in args, e.g. "atraining+dp"
+    """
+    flags = [("atraining", "atraining"), ("ptraining", "declustering"),
+             ("is_add_gradient_noise", "dp"), ("is_add_loss_noise", "loss_noise"),
+             ("is_add_raw_gradient_noise", "gradient_noise")]
+    defense = [name for flag, name in flags if getattr(args, flag, False)]
+    return "+".join(defense) if defense else "none"
+
+
+def connect(filename, timeout=60.):
+    conn = sqlite3.connect(filename, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class ResultsStore:
+    def __init__(self, filename, flush_every=64):
+        """
+        Args:
+            filename (str): SQLite file, created if needed
+            flush_every (int): Number of buffered epoch metrics written per transaction
+        """
+        self.conn = connect(filename)
+        self.flush_every = flush_every
+        self.buffer = []
+        self.run_id = None
+
+    def start_run(self, args):
+        config = {k: v if isinstance(v, (int, float, str, type(None))) else str(v) for k, v in vars(args).items()}
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (dataset, defense, host, pid, started, status) VALUES (?, ?, ?, ?, ?, 'running')",
+                (args.dataset, get_defense(args), socket.gethostname(), os.getpid(), time.time()))
+            self.run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO configs (run_id, key, value) VALUES (?, ?, ?)",
+                [(self.run_id, k, json.dumps(v)) for k, v in config.items()])
+        return self.run_id
+
+    def log_epoch(self, phase, epoch, **metrics):
+        self.buffer.extend((self.run_id, phase, epoch, k, v) for k, v in metrics.items())
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO epoch_metrics (run_id, phase, epoch, metric, value) VALUES (?, ?, ?, ?, ?)",
+                self.buffer)
+        self.buffer = []
+
+    def finish_run(self, task_acc=None, gender_acc=None, age_acc=None, epsilon=None, status="finished"):
+        with self.conn:
+            if self.buffer:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO epoch_metrics (run_id, phase, epoch, metric, value) VALUES (?, ?, ?, ?, ?)",
+                    self.buffer)
+                self.buffer = []
+            self.conn.execute(
+                "INSERT OR REPLACE INTO final_metrics (run_id, task_acc, gender_acc, age_acc, epsilon) VALUES (?, ?, ?, ?, ?)",
+                (self.run_id, task_acc, gender_acc, age_acc, epsilon))
+            self.conn.execute("UPDATE runs SET finished = ?, status = ? WHERE id = ?", (time.time(), status, self.run_id))
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def pareto_front(rows):
+    """
+    rows: (run_id, task_acc, leakage, ...) tuples. Keeps the runs no other run beats on both
+    higher task accuracy and lower leakage.
+    """
+    front = []
+    best_acc = float("-inf")
+    for row in sorted(rows, key=lambda r: (r[2], -r[1])):
+        if row[1] > best_acc:
+            front.append(row)
+            best_acc = row[1]
+    return front
+
+
+def query_pareto(conn, dataset=None, leakage="max"):
+    """
+    Returns {(dataset, defense): pareto front of (run_id, task_acc, leakage, epsilon)}
+    """
+    sql = f"""
+        SELECT r.dataset, r.defense, r.id, f.task_acc, {LEAKAGE[leakage]}, f.epsilon
+        FROM runs r JOIN final_metrics f ON f.run_id = r.id
+        WHERE r.status = 'finished' AND f.task_acc IS NOT NULL AND f.gender_acc IS NOT NULL
+    """
+    params = ()
+    if dataset is not None:
+        sql += " AND r.dataset = ?"
+        params = (dataset,)
+    groups = {}
+    for dataset, defense, *row in conn.execute(sql, params):
+        groups.setdefault((dataset, defense), []).append(tuple(row))
+    return {key: pareto_front(rows) for key, rows in sorted(groups.items())}
+
+
+def print_pareto(fronts, leakage="max"):
+    for (dataset, defense), front in fronts.items():
+        print(f"[{dataset} / {defense}]")
+        print(f"  {'run':>6}  {'task acc':>9}  {'leakage (' + leakage + ')':>15}  {'epsilon':>8}")
+        for run_id, task_acc, leak, epsilon in front:
+            eps = f"{epsilon:8.3f}" if epsilon is not None else f"{'-':>8}"
+            print(f"  {run_id:>6}  {task_acc:9.3f}  {leak:15.3f}  {eps}")
+
+
+def print_runs(conn, dataset=None):
+    sql = """
+        SELECT r.id, r.dataset, r.defense, r.status, f.task_acc, f.gender_acc, f.age_acc, f.epsilon
+        FROM runs r LEFT JOIN final_metrics f ON f.run_id = r.id
+    """
+    params = ()
+    if dataset is not None:
+        sql += " WHERE r.dataset = ?"
+        params = (dataset,)
+    for row in conn.execute(sql + " ORDER BY r.id", params):
+        print("  ".join("-" if v is None else str(v) for v in row))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the experiment results store")
+    parser.add_argument("db", type=str, help="SQLite results file")
+    parser.add_argument("command", choices=["pareto", "runs"], help="pareto: utility vs. leakage fronts per dataset and defense; runs: list runs")
+    parser.add_argument("--dataset", type=str, default=None, help="Only this dataset")
+    parser.add_argument("--leakage", default="max", choices=list(LEAKAGE), help="Leakage measure of the pareto fronts")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "pareto":
+        print_pareto(query_pareto(conn, args.dataset, args.leakage), args.leakage)
+    else:
+        print_runs(conn, args.dataset)
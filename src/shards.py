@@ -0,0 +1,191 @@
+"""
+Sharded on-disk format of an encoded split, for corpora larger than memory.
+
+A split is written as fixed-size shards of word ids (int32, n x seq_len), labels (int64) and aux
+bits (uint8, n x aux_size), one .npy file each, plus a manifest.json listing the shards. Shards are
+memory-mapped when read, so resident memory is bounded by the shuffle buffer, not the corpus size.
+The manifest also records what the word ids depend on (dataset, tokenizer, seq_len, vocabulary
+size, number of examples, see shard_key): shards that no longer match are stale and are rewritten.
+
+    python -m src.shards cache/ shards/ --seq_len 75
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+def encode(example, vocabulary, seq_len, aux_size):
+    sentence = example.get_sentence()[:seq_len]
+    sentence = sentence + ['<PAD>' for _ in range(0, seq_len - len(sentence))]
+    aux = example.get_aux_labels()
+    return vocabulary.code_sentence_w(sentence), example.get_label(), [1 if i in aux else 0 for i in range(aux_size)]
+
+
+def shard_key(cache, split, vocabulary, seq_len, aux_size):
+    """
+    Manifest entries the encoded shards of a cached split depend on
+    """
+    meta = cache.meta()
+    return {"dataset": meta.get("dataset"), "tokenizer": meta.get("tokenizer"), "seq_len": seq_len, "aux_size": aux_size,
+            "vocabulary_size": vocabulary.size_words(), "examples": cache.size(split)}
+
+
+def write_shards(examples, vocabulary, seq_len, directory, aux_size=2, shard_size=65536, **meta):
+    """
+    Encodes the examples shard by shard, so `examples` may be any iterable (e.g. CorpusCache.iterate)
+
+    Args:
+        meta: Extra manifest entries (dataset, tokenizer, see shard_key)
+
+    Returns:
+        dict: The manifest
+    """
+    os.makedirs(directory, exist_ok=True)
+    # the previous shards of the directory are stale from here on
+    for filename in glob.glob(os.path.join(directory, "manifest.json")) + glob.glob(os.path.join(directory, "shard*.npy")):
+        os.remove(filename)
+    manifest = dict(meta, seq_len=seq_len, aux_size=aux_size, vocabulary_size=vocabulary.size_words(), shards=[])
+
+    def flush(rows):
+        name = f"shard{len(manifest['shards']):05d}"
+        ids, labels, aux = zip(*rows)
+        np.save(os.path.join(directory, f"{name}.ids.npy"), np.asarray(ids, dtype=np.int32))
+        np.save(os.path.join(directory, f"{name}.labels.npy"), np.asarray(labels, dtype=np.int64))
+        np.save(os.path.join(directory, f"{name}.aux.npy"), np.asarray(aux, dtype=np.uint8))
+        manifest["shards"].append({"name": name, "size": len(rows)})
+
+    rows = []
+    for ex in examples:
+        rows.append(encode(ex, vocabulary, seq_len, aux_size))
+        if len(rows) == shard_size:
+            flush(rows)
+            rows = []
+    if rows:
+        flush(rows)
+    manifest["examples"] = sum(shard["size"] for shard in manifest["shards"])
+
+    # the manifest is written last: a directory without one is an interrupted write
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def has_shards(directory):
+    return os.path.exists(os.path.join(directory, "manifest.json"))
+
+
+def stale_keys(directory, key):
+    """
+    Entries of `key` (see shard_key) that differ in the manifest of `directory`, None if it has no shards
+    """
+    if not has_shards(directory):
+        return None
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    return [name for name, value in key.items() if manifest.get(name) != value]
+
+
+class ShardedDataset(IterableDataset):
+    def __init__(self, directory, shuffle=True, buffer_size=16384, block_size=1024, seed=0, return_aux=True,
+                 return_label=True):
+        """
+        Streams the examples of a sharded split in the format of PrDataset (of AttackDataset without label)
+
+        Args:
+            shuffle (bool): Shuffle the shard order and the examples through a bounded buffer
+            buffer_size (int): Examples held by the shuffle buffer
+            block_size (int): Contiguous rows read from a shard at once
+            seed (int): Base seed, combined with the epoch (see set_epoch)
+        """
+        super().__init__()
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.seq_len = self.manifest["seq_len"]
+        self.aux_size = self.manifest["aux_size"]
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.block_size = block_size
+        self.seed = seed
+        self.return_aux = return_aux
+        self.return_label = return_label
+        self.epoch = 0
+
+    def __len__(self):
+        return sum(shard["size"] for shard in self.manifest["shards"])
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _load(self, shard, kind):
+        return np.load(os.path.join(self.directory, f"{shard['name']}.{kind}.npy"), mmap_mode="r")
+
+    def _rows(self, shards, rng):
+        for shard in shards:
+            ids, labels, aux = (self._load(shard, kind) for kind in ["ids", "labels", "aux"])
+            starts = np.arange(0, shard["size"], self.block_size)
+            if self.shuffle:
+                rng.shuffle(starts)
+            for start in starts:
+                end = start + self.block_size
+                # one sequential read per block, then rows are handed out one by one
+                yield from zip(np.array(ids[start:end]), np.array(labels[start:end]), np.array(aux[start:end]))
+
+    def _item(self, row):
+        ids, label, aux = row
+        item = (torch.from_numpy(ids).long(),)
+        if self.return_aux:
+            item += (torch.from_numpy(aux).long(),)
+        if self.return_label:
+            item += (torch.tensor([label]),)
+        return item
+
+    def __iter__(self):
+        shards = list(self.manifest["shards"])
+        rng = np.random.default_rng([self.seed, self.epoch])
+        if self.shuffle:
+            rng.shuffle(shards)
+        # every worker reads a disjoint subset of the shards
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+            rng = np.random.default_rng([self.seed, self.epoch, worker.id])
+
+        if not self.shuffle:
+            yield from map(self._item, self._rows(shards, rng))
+            return
+        buffer = []
+        for row in self._rows(shards, rng):
+            if len(buffer) < self.buffer_size:
+                buffer.append(row)
+                continue
+            i = rng.integers(len(buffer))
+            yield self._item(buffer[i])
+            buffer[i] = row
+        rng.shuffle(buffer)
+        yield from map(self._item, buffer)
+
+
+if __name__ == "__main__":
+    from .corpus_cache import CorpusCache
+
+    parser = argparse.ArgumentParser(description="Write the cached splits of a corpus directory as shards")
+    parser.add_argument("corpus_dir", type=str, help="Corpus cache written with --corpus-dir")
+    parser.add_argument("shard_dir", type=str, help="Output directory, one subdirectory per split")
+    parser.add_argument("--seq_len", "-sl", type=int, default=75, help="Length of word sequence")
+    parser.add_argument("--shard-size", type=int, default=65536, help="Examples per shard")
+    args = parser.parse_args()
+
+    cache = CorpusCache(args.corpus_dir)
+    vocabulary = cache.load_vocabulary()
+    aux_size = cache.meta()["adversary_output_size"]
+    for split in ["train", "dev", "test"]:
+        key = shard_key(cache, split, vocabulary, args.seq_len, aux_size)
+        manifest = write_shards(cache.iterate(split), vocabulary, args.seq_len, os.path.join(args.shard_dir, split),
+                                aux_size=aux_size, shard_size=args.shard_size, dataset=key["dataset"], tokenizer=key["tokenizer"])
+        print(f"{split}: {sum(s['size'] for s in manifest['shards'])} examples in {len(manifest['shards'])} shards")
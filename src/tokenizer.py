@@ -0,0 +1,170 @@
+"""
+Word tokenizers of the readers.
+
+"nltk" is nltk.word_tokenize: Punkt sentence splitting, then the NLTK Treebank tokenizer on every
+sentence (about 25 regex substitutions per sentence). "regex" reproduces the same Treebank rules
+with one precompiled tokenizing regex over the whole review, and approximates Punkt by splitting a
+word-final period unless the word is an abbreviation. It needs neither NLTK nor the punkt data.
+
+    python -m src.tokenizer data/src/united_states.auto-adjusted_gender.geocoded.jsonl.tmp_filtered
+    (token agreement with word_tokenize and tokens/s of both tokenizers)
+
+    python -m src.tokenizer --check
+    (agreement with the word_tokenize outputs stored in tokenizer_samples.json, see check)
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+
+
+# always a token of their own (Treebank pads them with spaces)
+_SPLIT = r";@#$%&?!*‒-―\[\](){}<>«“‘„»”’`\""
+_CLOSERS = r"\]\)}>\"'»”’"
+# a period that ends a sentence: followed by closing brackets/quotes and a space
+_FINAL_PERIOD = rf"\.(?=[{_CLOSERS}]*(?:\s|$))"
+_CLITIC = r"(?:n't|N'T|'(?:[sSmMdD]|ll|LL|re|RE|ve|VE))"
+# token boundary, where the Treebank substitutions have put a space
+_BOUNDARY = rf"(?=\s|$|[{_SPLIT}]|[:,](?!\d)|--|\.{{2,}}|{_FINAL_PERIOD})"
+
+_OPENING_QUOTES = re.compile(r"(?:(?<=[ (\[{<])|^)(?:\"|'')")
+_TOKEN = re.compile(rf"""
+      \.{{2,}}                                          # ellipsis
+    | --
+    | `+ | ''
+    | [{_SPLIT}]
+    | [:,](?!\d)                                        # but not in 3,36 or 10:30
+    | {_FINAL_PERIOD}
+    | {_CLITIC}{_BOUNDARY}                              # do n't, it 's, we 're
+    | '{_BOUNDARY}                                      # closing single quote
+    | (?<!\w)'(?!(?i:re|ve|ll|m|t|s|d|n)\b)(?=\w)       # opening single quote
+    | (?:(?!{_CLITIC}{_BOUNDARY}|'{_BOUNDARY}|''|--|\.{{2,}}|{_FINAL_PERIOD})[^\s{_SPLIT},:]|[,:](?=\d))+
+""", re.VERBOSE)
+
+# MacIntyre contractions, split as in NLTK (wanna only before a space)
+_CONTRACTIONS = {"cannot": 3, "d'ye": 1, "gimme": 3, "gonna": 3, "gotta": 3, "lemme": 3, "more'n": 4, "wanna": 3}
+
+_CLOSING = {"'", "''", "”", "’", "»", ")", "]", "}", ">"}
+
+# Punkt does not end a sentence after these
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "etc", "inc", "ltd", "co", "corp", "no", "nos",
+    "approx", "dept", "est", "fig", "vol", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept",
+    "oct", "nov", "dec", "mon", "tue", "wed", "thu", "fri", "sat", "sun", "ave", "rd", "mt", "ft", "min",
+}
+
+
+def _abbreviation(word):
+    word = word.lower()
+    return word in ABBREVIATIONS or "." in word or (len(word) == 1 and word.isalpha())
+
+
+def regex_tokenize(text):
+    tokens = _TOKEN.findall(_OPENING_QUOTES.sub(" `` ", text))
+    out = []
+    last = len(tokens) - 1
+    # the period of the last sentence (before closing quotes and brackets) is always split
+    end = last
+    while end > 0 and tokens[end] in _CLOSING:
+        end -= 1
+    for i, token in enumerate(tokens):
+        if token == '"':
+            token = "''"
+        elif token == "." and 0 < i < end and out and _abbreviation(out[-1]):
+            # no sentence break after an abbreviation, the period stays in the word
+            out[-1] += "."
+            continue
+        else:
+            n = _CONTRACTIONS.get(token.lower())
+            if n is not None and (token.lower() != "wanna" or i < last):
+                out.append(token[:n])
+                token = token[n:]
+        out.append(token)
+    return out
+
+
+def nltk_tokenize(text):
+    from nltk.tokenize import word_tokenize
+    return word_tokenize(text)
+
+
+TOKENIZERS = {"nltk": nltk_tokenize, "regex": regex_tokenize}
+
+
+def agreement(reference, tokens):
+    """
+    Token-level agreement (multiset F1) between two tokenizations
+    """
+    overlap = sum((Counter(reference) & Counter(tokens)).values())
+    return 2 * overlap / max(len(reference) + len(tokens), 1)
+
+
+def compare(texts):
+    results = {}
+    for name, tokenize in TOKENIZERS.items():
+        start = time.perf_counter()
+        tokenized = [tokenize(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        results[name] = tokenized
+        n = sum(len(tokens) for tokens in tokenized)
+        print(f"[{name}] {len(texts)} reviews, {n} tokens in {elapsed:.2f}s: {n / elapsed:.0f} tokens/s")
+
+    reference, tokenized = results["nltk"], results["regex"]
+    exact = sum(a == b for a, b in zip(reference, tokenized))
+    mean_agreement = sum(agreement(a, b) for a, b in zip(reference, tokenized)) / len(texts)
+    print(f"[regex vs nltk] identical reviews: {exact / len(texts) * 100:.2f}%, token agreement: {mean_agreement * 100:.2f}%")
+    return exact / len(texts), mean_agreement
+
+
+SAMPLES = os.path.join(os.path.dirname(__file__), "tokenizer_samples.json")
+
+
+def check(samples=SAMPLES, min_exact=0.95, min_agreement=0.99):
+    """
+    Asserts the agreement of regex_tokenize with fixed review strings and the outputs NLTK 3.10.3
+    word_tokenize (punkt_tab, english) gives for them. Two samples are known to differ: Punkt breaks
+    after "e.g." and "Approx." when a number follows, regex keeps the period in the word. When NLTK
+    and its punkt data are installed, word_tokenize has to reproduce the stored outputs too.
+    """
+    with open(samples, encoding="utf-8") as f:
+        samples = json.load(f)
+    tokenized = [regex_tokenize(sample["text"]) for sample in samples]
+    for sample, tokens in zip(samples, tokenized):
+        if tokens != sample["tokens"]:
+            print(f"[regex] {sample['text']!r}: {tokens} != {sample['tokens']}")
+    exact = sum(sample["tokens"] == tokens for sample, tokens in zip(samples, tokenized)) / len(samples)
+    mean_agreement = sum(agreement(sample["tokens"], tokens) for sample, tokens in zip(samples, tokenized)) / len(samples)
+    print(f"[regex vs samples] identical reviews: {exact * 100:.2f}%, token agreement: {mean_agreement * 100:.2f}%")
+    assert exact >= min_exact and mean_agreement >= min_agreement, \
+        f"regex tokenizer below {min_exact * 100:.0f}% identical reviews / {min_agreement * 100:.0f}% token agreement"
+
+    try:
+        import nltk
+        nltk.data.find("tokenizers/punkt_tab/english/")
+    except (ImportError, LookupError):
+        print("[nltk] nltk or its punkt data is not installed, skipped")
+        return exact, mean_agreement
+    changed = [sample["text"] for sample in samples if nltk_tokenize(sample["text"]) != sample["tokens"]]
+    assert not changed, f"nltk {nltk.__version__} word_tokenize differs from the stored outputs on {changed}"
+    print(f"[nltk] word_tokenize reproduces the {len(samples)} stored outputs")
+    return exact, mean_agreement
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the regex tokenizer with nltk word_tokenize on reviews")
+    parser.add_argument("filename", type=str, nargs="?", help="Raw Trustpilot jsonl file")
+    parser.add_argument("--size", type=int, default=10000, help="Number of reviews")
+    parser.add_argument("--check", action="store_true", help="Check the agreement on the stored samples instead")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        raise SystemExit(0)
+    if args.filename is None:
+        parser.error("a filename is needed without --check")
+
+    from .tp_data_reader import get_raw_data, review_text
+    texts = [text for text in map(review_text, get_raw_data(args.filename)[:args.size]) if text is not None]
+    compare(texts)
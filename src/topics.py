@@ -0,0 +1,191 @@
+"""
+Topic labels of the blog authorship corpus, by streaming topic modeling.
+
+Posts are tokenized and hashed into bags of words in parallel chunks (HashingVectorizer is stateless,
+so there is no vocabulary pass), and an online LDA (or minibatch NMF) is updated one chunk at a time,
+so memory does not grow with the corpus. The dominant topic of each post is its main-task label; the
+labeled posts are written into a corpus cache split 10/10/80 as get_dataset, ready for
+`python -m src.main bl --corpus-dir DIR`.
+
+    python -m src.topics data/blogs/blogs cache/bl --topics 10 --workers 8
+"""
+import argparse
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .blog_data_reader import count_posts, read_blogs
+from .corpus_cache import CorpusCache
+from .example import Example
+from .optional import require
+from .tokenizer import TOKENIZERS
+
+
+POSTS = "posts"
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bounded_map(pool, fn, iterable, inflight):
+    """
+    pool.map that keeps at most `inflight` chunks in flight, in order (Executor.map reads all the input)
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= inflight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _analyzer(tokens):
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return [t for t in (t.lower() for t in tokens) if t.isalpha() and t not in ENGLISH_STOP_WORDS]
+
+
+_vectorizers = {}
+
+
+def vectorize(token_lists, hash_bits=18, method="lda"):
+    if (hash_bits, method) not in _vectorizers:
+        text = require("sklearn.feature_extraction.text", "src.topics")
+        # raw counts for LDA, l2-normalized for NMF
+        _vectorizers[hash_bits, method] = text.HashingVectorizer(
+            n_features=2 ** hash_bits, analyzer=_analyzer, alternate_sign=False, norm="l2" if method == "nmf" else None)
+    return _vectorizers[hash_bits, method].transform(token_lists)
+
+
+def _tokenize_chunk(args):
+    posts, hash_bits, method, tokenizer = args
+    tokenize = TOKENIZERS[tokenizer]
+    examples = [Example(post, -1, metadata=meta, user_id=user_id, tokenize=tokenize) for post, meta, user_id in posts]
+    examples = [ex for ex in examples if len(ex.get_sentence()) > 0]
+    return examples, vectorize([ex.get_sentence() for ex in examples], hash_bits, method)
+
+
+def _vectorize_chunk(args):
+    examples, hash_bits, method = args
+    return examples, vectorize([ex.get_sentence() for ex in examples], hash_bits, method)
+
+
+def build_model(method, n_topics, batch_size, seed, total_samples):
+    decomposition = require("sklearn.decomposition", "src.topics")
+    if method == "nmf":
+        return decomposition.MiniBatchNMF(n_components=n_topics, batch_size=batch_size, random_state=seed)
+    # online LDA scales every minibatch update by total_samples / batch size
+    return decomposition.LatentDirichletAllocation(n_components=n_topics, learning_method="online",
+                                                   batch_size=batch_size, total_samples=total_samples, random_state=seed)
+
+
+class Throughput:
+    def __init__(self, name):
+        self.name = name
+        self.posts = 0
+        self.tokens = 0
+        self.start = time.perf_counter()
+
+    def update(self, examples):
+        self.posts += len(examples)
+        self.tokens += sum(len(ex.get_sentence()) for ex in examples)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        print(f"[topics {self.name}] {self.posts} posts, {self.tokens} tokens in {elapsed:.1f}s: "
+              f"{self.posts / elapsed:.0f} posts/s, {self.tokens / elapsed:.0f} tokens/s")
+
+
+def label_topics(blog_dir, corpus_dir, n_topics=10, method="lda", passes=1, chunk_size=2048, hash_bits=18, workers=4, seed=0,
+                 tokenizer="nltk"):
+    cache = CorpusCache(corpus_dir)
+    # the posts are counted before the first update (only the regex match, no tokenization)
+    model = build_model(method, n_topics, chunk_size, seed, count_posts(blog_dir))
+    inflight = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # pass 1: tokenize (kept in the cache, so later passes skip it), hash, update the model
+        cache.remove(POSTS)
+        throughput = Throughput("pass 1")
+        tasks = ((chunk, hash_bits, method, tokenizer) for chunk in chunks(read_blogs(blog_dir), chunk_size))
+        for examples, X in bounded_map(pool, _tokenize_chunk, tasks, inflight):
+            cache.append(POSTS, examples)
+            model.partial_fit(X)
+            throughput.update(examples)
+        throughput.report()
+        # posts without any token were dropped
+        n = cache.size(POSTS)
+        if method == "lda":
+            model.total_samples = n
+
+        def hashed(name):
+            throughput = Throughput(name)
+            tasks = ((chunk, hash_bits, method) for chunk in chunks(cache.iterate(POSTS), chunk_size))
+            for examples, X in bounded_map(pool, _vectorize_chunk, tasks, inflight):
+                throughput.update(examples)
+                yield examples, X
+            throughput.report()
+
+        for p in range(1, passes):
+            for _, X in hashed(f"pass {p + 1}"):
+                model.partial_fit(X)
+
+        # label with the dominant topic and split 10/10/80
+        rng = np.random.RandomState(seed)
+        order = rng.permutation(n)
+        seg_size = n // 10
+        assign = np.full(n, 2, dtype=np.int8)
+        assign[order[:seg_size]] = 0
+        assign[order[seg_size:seg_size * 2]] = 1
+        splits = ["test", "dev", "train"]
+        for split in splits:
+            cache.remove(split)
+
+        sizes = np.zeros(n_topics, dtype=np.int64)
+        row = 0
+        for examples, X in hashed("labels"):
+            topics = model.transform(X).argmax(axis=1)
+            sizes += np.bincount(topics, minlength=n_topics)
+            per_split = {split: [] for split in splits}
+            for ex, topic in zip(examples, topics):
+                ex.label = int(topic)
+                per_split[splits[assign[row]]].append(ex)
+                row += 1
+            for split, split_examples in per_split.items():
+                cache.append(split, split_examples)
+
+    cache.remove(POSTS)
+    with open(cache._path("meta.json"), "w") as f:
+        json.dump({"classifier_output_size": n_topics, "adversary_output_size": 2, "topic_sizes": sizes.tolist(),
+                   "dataset": "bl", "tokenizer": tokenizer}, f)
+    print(f"[topics] posts per topic: {sizes.tolist()}")
+    return sizes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label the blog corpus with topics and write it into a corpus cache")
+    parser.add_argument("blog_dir", type=str, help="Directory of the blog authorship xml files")
+    parser.add_argument("corpus_dir", type=str, help="Corpus cache to write (see --corpus-dir of src.main)")
+    parser.add_argument("--topics", type=int, default=10, help="Number of topics, i.e. main-task labels")
+    parser.add_argument("--method", default="lda", choices=["lda", "nmf"], help="Online LDA or minibatch NMF, [default=lda]")
+    parser.add_argument("--passes", type=int, default=1, help="Passes of the model over the corpus")
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Posts per chunk (and model minibatch)")
+    parser.add_argument("--hash-bits", type=int, default=18, help="log2 of the hashed vocabulary size")
+    parser.add_argument("--workers", type=int, default=4, help="Processes tokenizing and hashing the chunks")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the model and of the split")
+    parser.add_argument("--tokenizer", default="nltk", choices=list(TOKENIZERS), help="Word tokenizer of the posts, [default=nltk]")
+    args = parser.parse_args()
+
+    label_topics(args.blog_dir, args.corpus_dir, args.topics, args.method, args.passes, args.chunk_size,
+                 args.hash_bits, args.workers, args.seed, args.tokenizer)
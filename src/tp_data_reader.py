@@ -3,6 +3,7 @@ from ast import literal_eval
 from pprint import pprint
 
 from .example import Example
+from .tokenizer import TOKENIZERS
 
 import random
 random.seed(10)
@@ -54,16 +55,23 @@ def get_raw_data(filename):
     return data
 
 
-def construct_examples(raw_data):
+def review_text(o):
+    d = o['reviews'][0]
+    if None in [d['text'], d['rating']]:
+        return None
+    if d['title'] is None:
+        d['title'] = ""
+    return d['title'] + " " + " STOP START ".join(d['text'])
+
+
+def construct_examples(raw_data, tokenizer="nltk"):
+    tokenize = TOKENIZERS[tokenizer]
     examples = []
     for o in raw_data:
         d = o['reviews'][0]
-        if None in [d['text'], d['rating']]:
+        review = review_text(o)
+        if review is None:
             continue
-        if d['title'] is None:
-            d['title'] = ""
-        
-        review = d['title'] + " " + " STOP START ".join(d['text'])
 
         if 'gender' in o and 'birth_year' in o:
             if o['gender'] is None or o['birth_year'] is None:
@@ -78,7 +86,7 @@ def construct_examples(raw_data):
                     meta.add(GENDER)
                 if age:
                     meta.add(BIRTH)
-                ex = Example(review, int(d['rating']) - 1, metadata=meta)
+                ex = Example(review, int(d['rating']) - 1, metadata=meta, user_id=o.get('user_id'), tokenize=tokenize)
                 
                 if len(ex.get_sentence()) == 0:
                     continue
@@ -86,7 +94,7 @@ def construct_examples(raw_data):
     return examples
 
 
-def get_dataset(lang):
+def get_dataset(lang, tokenizer="nltk"):
     lang_map = {"fr": "france",
                 "de": "germany",
                 "dk": "denmark",
@@ -99,7 +107,7 @@ def get_dataset(lang):
     filename = "data/src/{}.auto-adjusted_gender.{}.jsonl.tmp_filtered".format(lang_map[lang], filler)
     
     raw_data = get_raw_data(filename)
-    examples = construct_examples(raw_data)
+    examples = construct_examples(raw_data, tokenizer)
     
     #if add_demographics:
         #for ex in examples:
@@ -51,6 +51,24 @@ class Vocabulary:
         self.c2i = {c: i for i, c in enumerate(self.chars)}
 
 
+    def extend(self, word_freqs):
+        """
+        Adds the unseen words of word_freqs after the existing ones, so that existing ids never change.
+        Returns the list of new words.
+        """
+        new_words = sorted(w for w in word_freqs if w not in self.w2i)
+        for w, f in word_freqs.items():
+            self.word_freqs[w] = self.word_freqs.get(w, 0) + f
+        for w in new_words:
+            self.w2i[w] = len(self.words)
+            self.words.append(w)
+
+        new_chars = sorted(set(c for w in new_words for c in w if c not in self.c2i))
+        for c in new_chars:
+            self.c2i[c] = len(self.chars)
+            self.chars.append(c)
+        return new_words
+
     def code_sentence_w(self, sentence, stochastic_replacement=False):
         return [self.code_word(w, stochastic_replacement) for w in sentence]
 